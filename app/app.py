@@ -1,20 +1,28 @@
 from dotenv import load_dotenv
 import os
+from datetime import datetime
 from functools import wraps
-import time
+import hmac
 import json
-from datetime import datetime
 
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, session, flash, jsonify
+    url_for, session, flash, jsonify, Response, stream_with_context
 )
-
-from app.llm import generate_summary, generate_flashcards
-from app.rag import init_vector_store, add_note_to_rag, query_context
+from markupsafe import escape
+
+from app.pipeline import process_note_events
+from app import metrics
+from app.config import METRICS_TOKEN, MODEL_WARMUP, START_JOB_WORKERS
+from app.jobs import QueueFullError, job_stats, job_status, start_workers, submit_job
+from app.models import model_stats, warm_up
+from app.ocr_cache import cache_stats as ocr_cache_stats
+from app.rag import init_vector_store, remove_note_from_rag, rag_stats
 from app.safety import validate_user_input
-from app.telemetry import log_telemetry
-from app.database import init_db, save_note, get_all_notes, get_note_by_id, delete_note
+from app.telemetry import Trace, telemetry_stats
+from app.database import (
+    MATCH_END, MATCH_START, delete_note, get_note_by_id, get_notes_page, init_db, search_notes,
+)
 
 # ----- Environment & Flask setup ----- #
 
@@ -34,12 +42,26 @@ app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret-key")
 DEMO_USERNAME = os.getenv("DEMO_USERNAME", "demo")
 DEMO_PASSWORD = os.getenv("DEMO_PASSWORD", "password123")
 
-# Initialize SQLite + RAG
+# Initialize SQLite + RAG (reopens the on-disk embedding store)
 init_db()
 rag_client, rag_collection = init_vector_store()  # kept for compatibility, not used
 
+# Job workers: main.py starts them; under a WSGI server set START_JOB_WORKERS=1
+if START_JOB_WORKERS:
+    start_workers()
+
+# Models load on first use; optionally start loading them now, off the boot path
+if MODEL_WARMUP:
+    warm_up([name.strip() for name in MODEL_WARMUP.split(",")], background=True)
+
 ALLOWED_EXTENSIONS = {"txt", "pdf"}
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE = 200
+SEARCH_PAGE_SIZE = 20
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
 
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -94,8 +116,52 @@ def dashboard():
 @app.route("/history", methods=["GET"])
 @login_required
 def history():
-    notes = get_all_notes()
-    return render_template("history.html", notes=notes)
+    # First page only; the rest is fetched from /api/notes as the user scrolls
+    notes = get_notes_page(limit=HISTORY_PAGE_SIZE)
+    next_before = notes[-1][0] if len(notes) == HISTORY_PAGE_SIZE else None
+    return render_template("history.html", notes=notes, next_before=next_before)
+
+
+@app.route("/api/notes", methods=["GET"])
+@login_required
+def notes_page_route():
+    """Keyset-paginated history: ?before=<id>&limit=<n>, newest first."""
+    before = request.args.get("before", type=int)
+    limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE)
+    notes = get_notes_page(before_id=before, limit=limit)
+    return jsonify({
+        "notes": [
+            {"id": note_id, "timestamp": timestamp, "preview": preview or ""}
+            for note_id, timestamp, preview in notes
+        ],
+        "next_before": notes[-1][0] if len(notes) == limit else None,
+    })
+
+
+def _highlight(snippet: str) -> str:
+    """Escape a search snippet, then mark the matched terms."""
+    return str(escape(snippet)).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+
+@app.route("/api/search", methods=["GET"])
+@login_required
+def search_route():
+    """Full-text search over notes, summaries and flashcards: ?q=&page=&limit="""
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    limit = min(max(request.args.get("limit", SEARCH_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE)
+
+    # One extra row tells us whether there is a next page without a COUNT
+    rows = search_notes(query, limit=limit + 1, offset=(page - 1) * limit)
+    return jsonify({
+        "query": query,
+        "page": page,
+        "has_more": len(rows) > limit,
+        "results": [
+            {"id": note_id, "timestamp": timestamp, "snippet": _highlight(snippet), "score": round(-score, 4)}
+            for note_id, timestamp, snippet, score in rows[:limit]
+        ],
+    })
 
 
 @app.route("/note/<int:note_id>", methods=["GET"])
@@ -121,6 +187,7 @@ def view_note(note_id):
 def delete_note_route(note_id):
     try:
         delete_note(note_id)
+        remove_note_from_rag(note_id)
         return redirect("/history")
     except Exception as e:
         print("Delete error:", e)
@@ -128,8 +195,78 @@ def delete_note_route(note_id):
 
 
 
+@app.route("/api/rag/stats", methods=["GET"])
+@login_required
+def rag_stats_route():
+    stats = rag_stats()
+    stats["models"] = model_stats()
+    stats["ocr_cache"] = ocr_cache_stats()
+    stats["telemetry"] = telemetry_stats()
+    return jsonify(stats)
+
+
+# ----- Metrics ----- #
+
+@app.route("/api/metrics", methods=["GET"])
+@login_required
+def metrics_route():
+    """
+    Latency percentiles, error rate, tokens and cost per pathway over
+    rolling windows (?window=5m|1h|24h, default all). ?format=prometheus
+    returns the text exposition instead.
+    """
+    if request.args.get("format") == "prometheus":
+        return Response(metrics.prometheus_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    window = request.args.get("window")
+    if window and window not in metrics.WINDOWS:
+        return jsonify({"error": f"window must be one of {', '.join(metrics.WINDOWS)}"}), 400
+    return jsonify({
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "windows": metrics.snapshot([window] if window else None),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_route():
+    """Scrape target: Authorization: Bearer METRICS_TOKEN, or a logged-in session."""
+    authorized = session.get("logged_in") or (
+        METRICS_TOKEN
+        and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    )
+    if not authorized:
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.prometheus_text(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # ----- Core API: process note ----- #
 
+def _note_input(trace: Trace | None = None):
+    """
+    Pull the note out of the request before any heavy work starts.
+    Returns (raw_text, upload, error) where upload is (filename, bytes);
+    reading the upload is timed as an "upload_read" span on `trace`.
+    """
+    # 1) Check if user uploaded a file
+    file = request.files.get("file")
+
+    if file and file.filename and file.filename.strip():
+        filename = file.filename
+        if not allowed_file(filename):
+            return "", None, "Unsupported file type. Use .txt or .pdf"
+        if trace is None:
+            return "", (filename, file.read()), None
+        with trace.span("upload_read") as span:
+            data = file.read()
+            span["bytes"] = len(data)
+        return "", (filename, data), None
+
+    # 2) Fallback: use pasted textarea content
+    raw_text = request.form.get("note_text", "")
+    print("DEBUG pasted text:", repr(raw_text))
+    return raw_text, None, None
+
+
 @app.route("/api/process-note", methods=["POST"])
 @login_required
 def process_note():
@@ -137,88 +274,96 @@ def process_note():
     Core user flow:
       - Input: raw note text OR uploaded file (.txt / .pdf)
       - OCR for PDFs (pdfplumber -> Tesseract -> EasyOCR)
-      - RAG: store note text + retrieve similar notes
+      - RAG: retrieve similar past notes, then index this one
       - LLM: generate summary + flashcards
       - Save to SQLite for long-term memory
       - Log telemetry (latency, tokens, cost, error)
+    See app/pipeline.py for the steps.
     """
-    t_start = time.time()
-    pathway = "rag"
+    trace = Trace()
+    raw_text, upload, error = _note_input(trace)
+    if error:
+        return jsonify({"error": error}), 400
 
-    raw_text = ""
+    for event, data in process_note_events(raw_text, upload, trace=trace):
+        if event == "error":
+            return jsonify({"error": data["error"]}), data["status"]
+        if event == "result":
+            return jsonify(data)
 
-    # 1) Check if user uploaded a file
-    file = request.files.get("file")
 
-    if file and file.filename and file.filename.strip():
-        filename = file.filename
-        if not allowed_file(filename):
-            return jsonify({"error": "Unsupported file type. Use .txt or .pdf"}), 400
+@app.route("/api/process-note/stream", methods=["POST"])
+@login_required
+def process_note_stream():
+    """
+    Same pipeline as process_note, as server-sent events: stage progress
+    (ocr, context, llm), then summary deltas as the model produces them,
+    then a final "result" (or "error") event carrying the full payload.
+    """
+    trace = Trace()
+    raw_text, upload, error = _note_input(trace)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        # First bytes go out before OCR / retrieval start.
+        yield sse("stage", {"stage": "received"})
+        if error:
+            yield sse("error", {"error": error, "status": 400})
+            return
+        for event, data in process_note_events(raw_text, upload, stream_summary=True, trace=trace):
+            yield sse(event, data)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        ext = filename.rsplit(".", 1)[1].lower()
 
-        if ext == "txt":
-            raw_text = file.read().decode("utf-8", errors="ignore")
+# ----- Background jobs ----- #
 
-        elif ext == "pdf":
-            from app.ocr_utils import extract_text_pdf
-            pdf_bytes = file.read()
-            raw_text, method_used = extract_text_pdf(pdf_bytes)
-            print("OCR method used:", method_used)
+@app.route("/api/jobs", methods=["POST"])
+@login_required
+def submit_job_route():
+    """
+    Queue a note (same form fields as /api/process-note) and return at once.
+    Poll GET /api/jobs/<job_id> for progress and the result.
+    """
+    raw_text, upload, error = _note_input()
+    if not error and upload is None:
+        # Pasted text can be checked now; uploads are checked after OCR.
+        _, error = validate_user_input(raw_text)
+    if error:
+        return jsonify({"error": error}), 400
 
-    else:
-        # 2) Fallback: use pasted textarea content
-        raw_text = request.form.get("note_text", "")
-        print("DEBUG pasted text:", repr(raw_text))
+    try:
+        job_id = submit_job(raw_text, upload)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
 
-    # 3) Safety guardrails
-    is_valid, error_message = validate_user_input(raw_text)
-    if not is_valid:
-        latency_ms = int((time.time() - t_start) * 1000)
-        log_telemetry(pathway, latency_ms, None, None, None, error_message)
-        return jsonify({"error": error_message}), 400
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("job_status_route", job_id=job_id),
+        "queue_depth": job_stats()["queue_depth"],
+    }), 202
 
-    # 4) Add to RAG corpus (in-memory)
-    note_id = f"note-{int(time.time())}"
-    add_note_to_rag(note_id, raw_text)
 
-    # 5) Retrieve RAG context using this note as query
-    context_chunks = query_context(query=raw_text, k=4)
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status_route(job_id):
+    job = job_status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
-    try:
-        # 6) LLM: summary + flashcards
-        summary, usage_sum = generate_summary(raw_text, context_chunks)
-        flashcards, usage_cards = generate_flashcards(raw_text, context_chunks)
-
-        latency_ms = int((time.time() - t_start) * 1000)
-
-        tokens_in = (usage_sum.get("prompt_tokens", 0) +
-                     usage_cards.get("prompt_tokens", 0))
-        tokens_out = (usage_sum.get("completion_tokens", 0) +
-                      usage_cards.get("completion_tokens", 0))
-        cost = usage_sum.get("cost_usd", 0.0) + usage_cards.get("cost_usd", 0.0)
-
-        # 7) Persist note to SQLite
-        timestamp = datetime.now().isoformat(timespec="seconds")
-        save_note(raw_text, summary, json.dumps(flashcards), timestamp)
-
-        # 8) Telemetry logging
-        log_telemetry(pathway, latency_ms, tokens_in, tokens_out, cost, None)
-
-        return jsonify({
-            "summary": summary,
-            "flashcards": flashcards,
-            "latency_ms": latency_ms,
-            "tokens_in": tokens_in,
-            "tokens_out": tokens_out,
-            "cost_usd": cost
-        })
 
-    except Exception as e:
-        print("🔥 ERROR in process_note:", type(e), str(e))
-        latency_ms = int((time.time() - t_start) * 1000)
-        log_telemetry(pathway, latency_ms, None, None, None, str(e))
-        return jsonify({"error": "AI failed to process the note"}), 500
+@app.route("/api/jobs", methods=["GET"])
+@login_required
+def job_stats_route():
+    return jsonify(job_stats())
 
 
 if __name__ == "__main__":
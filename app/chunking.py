@@ -0,0 +1,66 @@
+# chunking.py
+"""
+Split note text into overlapping, sentence-aligned passages for RAG.
+
+Passages are returned as (start, end) character offsets into the original
+text, so the index only has to store offsets and can slice the note back
+out of SQLite at query time.
+"""
+
+import re
+from typing import List, Tuple
+
+# Sentence ends, or blank lines between paragraphs / PDF pages
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def _sentence_spans(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    spans = []
+    pos = 0
+    for m in _SENTENCE_BREAK.finditer(text):
+        spans.append((pos, m.start()))
+        pos = m.end()
+    spans.append((pos, len(text)))
+
+    # Drop blanks and hard-split run-on "sentences" (tables, OCR noise).
+    out = []
+    for start, end in spans:
+        while end - start > max_chars:
+            out.append((start, start + max_chars))
+            start += max_chars
+        if text[start:end].strip():
+            out.append((start, end))
+    return out
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+def chunk_text(text: str, max_chars: int = 800, overlap: int = 1) -> List[Tuple[int, int]]:
+    """
+    Greedily pack whole sentences into windows of at most max_chars.
+    Each window after the first starts with the last `overlap` sentences
+    of the previous one.
+    """
+    sentences = _sentence_spans(text, max_chars)
+    if not sentences:
+        return []
+
+    chunks = []
+    i = 0
+    while i < len(sentences):
+        j = i + 1
+        while j < len(sentences) and sentences[j][1] - sentences[i][0] <= max_chars:
+            j += 1
+        chunks.append((sentences[i][0], sentences[j - 1][1]))
+        if j >= len(sentences):
+            break
+        # Step forward, keeping some overlap when the next sentence still
+        # fits alongside it; otherwise the window would repeat old text only.
+        nxt = max(j - overlap, i + 1)
+        if sentences[j][1] - sentences[nxt][0] > max_chars:
+            nxt = j
+        i = nxt
+    return chunks
@@ -0,0 +1,131 @@
+# config.py
+"""
+Tunables read from the environment (.env is loaded here so values are
+available to modules imported before app.py calls load_dotenv).
+"""
+
+import os
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+# ----- SQLite ----- #
+
+# Notes + jobs database; pooled connections kept open between calls
+DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "memory.db"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# ----- RAG ----- #
+
+# Memory-mapped embedding matrix + id map, rebuilt from SQLite notes if missing
+RAG_STORE_DIR = os.getenv("RAG_STORE_DIR", os.path.join(DATA_DIR, "rag"))
+
+# Passage chunking (characters; MiniLM truncates at ~256 word pieces) and the
+# total size of retrieved context handed to the LLM (estimated tokens)
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "1"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "800"))
+
+# Search backend: "exact" (brute-force dot product), "ivf" (NumPy inverted
+# file, scans RAG_IVF_NPROBE lists) or "hnsw" (needs hnswlib)
+RAG_SEARCH_BACKEND = os.getenv("RAG_SEARCH_BACKEND", "exact")
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+RAG_HNSW_EF = int(os.getenv("RAG_HNSW_EF", "64"))
+
+# Deleted / edited notes leave tombstoned rows; the store is compacted once
+# they make up this fraction of it
+RAG_COMPACT_FRACTION = float(os.getenv("RAG_COMPACT_FRACTION", "0.25"))
+
+# Embedding cache: in-memory LRU entries, plus an optional SQLite file tier
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+
+# ----- Telemetry ----- #
+
+# Rows are queued and appended in batches by a background thread. A full
+# queue drops rows (counted) rather than blocking requests. The CSV is
+# rotated past TELEMETRY_MAX_MB, keeping TELEMETRY_BACKUPS old files.
+TELEMETRY_FILE = os.getenv("TELEMETRY_FILE", "telemetry.csv")
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "10000"))
+TELEMETRY_BATCH = int(os.getenv("TELEMETRY_BATCH", "200"))
+TELEMETRY_FLUSH_S = float(os.getenv("TELEMETRY_FLUSH_S", "1.0"))
+TELEMETRY_MAX_MB = float(os.getenv("TELEMETRY_MAX_MB", "10"))
+TELEMETRY_BACKUPS = int(os.getenv("TELEMETRY_BACKUPS", "5"))
+
+# Bearer token a Prometheus scraper sends to GET /metrics; empty = the
+# endpoint needs a logged-in session like the rest of the API
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# ----- LLM ----- #
+
+# How summary + flashcards are requested: "concurrent", "combined" (one call
+# returning both) or "sequential"
+LLM_MODE = os.getenv("LLM_MODE", "concurrent")
+LLM_THREADS = int(os.getenv("LLM_THREADS", "8"))
+
+# Shared OpenAI client: HTTP connection pool size, timeouts (seconds) and
+# SDK retries (exponential backoff on 429 / 5xx)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+
+# Prompt size budget in tokens (system + instructions + note + context);
+# retrieved context is trimmed to fit, lowest-ranked passages first
+LLM_PROMPT_TOKENS = int(os.getenv("LLM_PROMPT_TOKENS", "3000"))
+# Ask streamed responses for a final usage chunk (stream_options.include_usage)
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+# Extra / overriding prices, JSON {"model": [input, output]} in USD per 1M
+# tokens (see PRICES in tokens.py)
+LLM_PRICES = os.getenv("LLM_PRICES", "")
+
+# LLM response cache (SQLite); LLM_CACHE_PATH="" turns it off
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DATA_DIR, "llm_cache.db"))
+LLM_CACHE_TTL_S = int(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "50"))
+
+# ----- Background jobs ----- #
+
+# Worker threads per process, queued jobs accepted before POST /api/jobs
+# answers 503, and how long a 'running' job's heartbeat may stand still
+# before another process picks it up again
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_STALE_S = int(os.getenv("JOB_STALE_S", "600"))
+# Start the workers when app.app is imported (WSGI servers); main.py
+# starts them itself
+START_JOB_WORKERS = os.getenv("START_JOB_WORKERS", "0") == "1"
+
+# ----- OCR ----- #
+
+# Processes for per-page OCR (1 = run in the request thread)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Rasterization of pages that need OCR (pdf2image's default DPI is 200)
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1") == "1"
+
+# Page preprocessing: threshold "fixed" or "adaptive" (uneven lighting),
+# deskew scans up to ±5°, and downscale pages whose longest side exceeds
+# OCR_MAX_SIDE px (0 = never)
+OCR_THRESHOLD = os.getenv("OCR_THRESHOLD", "fixed")
+OCR_DESKEW = os.getenv("OCR_DESKEW", "0") == "1"
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "0"))
+
+# OCR page cache (SQLite); OCR_CACHE_PATH="" turns it off
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(DATA_DIR, "ocr_cache.db"))
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "20"))
+
+# Uploads longer than the input limit: "reject" (400) or "truncate" to it.
+# PDFs stop being OCR'd as soon as they pass the limit either way.
+UPLOAD_OVERFLOW = os.getenv("UPLOAD_OVERFLOW", "reject")
+
+# ----- Models ----- #
+
+# Comma-separated models to load in the background at startup
+# ("embedder", "easyocr"); empty = load each on first use
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "")
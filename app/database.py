@@ -1,23 +1,153 @@
+# database.py
+"""
+SQLite data layer for notes and background jobs.
+
+- Connections are pooled and reused rather than opened per call, so
+  sqlite3's per-connection statement cache keeps queries prepared
+- WAL journal: readers don't block the writer and vice versa
+- Connections run in autocommit mode; multi-statement writes go through
+  transaction() (BEGIN IMMEDIATE, so writers queue on busy_timeout
+  instead of failing on lock upgrades)
+- Schema changes are numbered migrations tracked in PRAGMA user_version
+"""
 
-import sqlite3
-from typing import List, Tuple, Optional
 import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional
+
+from app.config import DB_BUSY_TIMEOUT_MS, DB_PATH, DB_POOL_SIZE
+
+PREVIEW_CHARS = 120
+
+_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # durable at checkpoints; safe with WAL
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",  # KiB, per connection
+]
+
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+
+
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,  # autocommit; see transaction()
+        check_same_thread=False,  # pooled: one thread at a time
+        cached_statements=256,
+    )
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of the block."""
+    global _pool, _pool_pid
+    if os.getpid() != _pool_pid:
+        # Forked worker: never reuse the parent's connections
+        with _pool_lock:
+            if os.getpid() != _pool_pid:
+                _pool, _pool_pid = queue.LifoQueue(), os.getpid()
+
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open()
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if _pool.qsize() < DB_POOL_SIZE:
+            _pool.put(conn)
+        else:
+            conn.close()
 
-# Base directory of the project (root folder)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# Database location inside /data/memory.db
-DB_PATH = os.path.join(BASE_DIR, "data", "memory.db")
+@contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT on a pooled connection; rolls back on error."""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def close_pool() -> None:
+    """Close idle pooled connections (tests, shutdown)."""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
 
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    """A standalone connection with the same settings (caller closes it)."""
+    return _open()
 
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
+# ----- Schema migrations ----- #
+# Append only: each entry runs once, in order, and bumps PRAGMA user_version.
+
+def _flashcard_text(column: str) -> str:
+    """
+    SQL for the questions and answers in a flashcards_json column, as plain
+    text. Items that aren't objects (older notes stored whatever the model
+    returned, e.g. "Q: ... A: ..." strings) are skipped: json_extract would
+    fail on them.
+    """
+    return f"""(
+        SELECT group_concat(
+            coalesce(json_extract(value, '$.question'), '') || ' ' ||
+            coalesce(json_extract(value, '$.answer'), ''), char(10))
+        FROM json_each(CASE WHEN json_valid({column}) THEN {column} ELSE '[]' END)
+        WHERE type = 'object'
+    )"""
+
+
+# Keep notes_fts in step with notes (migrations 3 and 5)
+_FTS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts (rowid, raw_text, summary, flashcards)
+        VALUES (new.id, new.raw_text, new.summary, {_flashcard_text("new.flashcards_json")});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+        DELETE FROM notes_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_update
+    AFTER UPDATE OF raw_text, summary, flashcards_json ON notes BEGIN
+        DELETE FROM notes_fts WHERE rowid = old.id;
+        INSERT INTO notes_fts (rowid, raw_text, summary, flashcards)
+        VALUES (new.id, new.raw_text, new.summary, {_flashcard_text("new.flashcards_json")});
+    END
+    """,
+]
+
+
+_MIGRATIONS: List[List[str]] = [
+    # 1: notes + jobs (also matches databases created before versioning)
+    [
         """
         CREATE TABLE IF NOT EXISTS notes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,49 +156,289 @@ def init_db():
             summary TEXT,
             flashcards_json TEXT
         )
+        """,
         """
-    )
-    conn.commit()
-    conn.close()
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            stage TEXT,
+            created TEXT,
+            started TEXT,
+            finished TEXT,
+            raw_text TEXT,
+            filename TEXT,
+            upload BLOB,
+            result_json TEXT,
+            error TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created)",
+    ],
+    # 2: stored preview for the history list, and a covering index so
+    #    paging never touches the (large) note rows
+    [
+        "ALTER TABLE notes ADD COLUMN preview TEXT",
+        f"UPDATE notes SET preview = substr(raw_text, 1, {PREVIEW_CHARS})",
+        "CREATE INDEX IF NOT EXISTS idx_notes_history ON notes (id, timestamp, preview)",
+    ],
+    # 3: full-text search over note, summary and flashcard text, kept in
+    #    sync by triggers (flashcards indexed as question/answer text, not JSON)
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            raw_text, summary, flashcards,
+            tokenize = 'porter unicode61'
+        )
+        """,
+        # rank = bm25 with column weights: summary and flashcard hits rank
+        # above body text
+        "INSERT INTO notes_fts (notes_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0, 1.5)')",
+        f"""
+        INSERT INTO notes_fts (rowid, raw_text, summary, flashcards)
+        SELECT id, raw_text, summary, {_flashcard_text("notes.flashcards_json")} FROM notes
+        """,
+        *_FTS_TRIGGERS,
+    ],
+    # 4: job heartbeat, bumped by the process running the job; a job is
+    #    only stale once this stops moving
+    [
+        "ALTER TABLE jobs ADD COLUMN heartbeat TEXT",
+        "UPDATE jobs SET heartbeat = coalesce(started, created) WHERE status = 'running'",
+    ],
+    # 5: triggers from 3 rebuilt to skip non-object flashcard items, which
+    #    made json_extract (and so the note insert) fail
+    [
+        "DROP TRIGGER IF EXISTS notes_fts_insert",
+        "DROP TRIGGER IF EXISTS notes_fts_delete",
+        "DROP TRIGGER IF EXISTS notes_fts_update",
+        *_FTS_TRIGGERS,
+    ],
+]
 
 
-def save_note(raw_text: str, summary: str, flashcards_json: str, timestamp: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO notes (timestamp, raw_text, summary, flashcards_json) VALUES (?, ?, ?, ?)",
-        (timestamp, raw_text, summary, flashcards_json),
-    )
-    conn.commit()
-    conn.close()
+def _migrate(conn) -> int:
+    """Apply pending migrations; returns the schema version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(_MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another process may have migrated
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                conn.execute("COMMIT")
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[db] Migrated schema to version {number}")
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
 
-def get_all_notes() -> List[Tuple]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, timestamp, substr(raw_text,1,120) as preview FROM notes ORDER BY id DESC"
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+def init_db():
+    os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
+    with connection() as conn:
+        _migrate(conn)
+
+
+def save_note(raw_text: str, summary: str, flashcards_json: str, timestamp: str) -> int:
+    with connection() as conn:
+        cur = conn.execute(
+            "INSERT INTO notes (timestamp, raw_text, summary, flashcards_json, preview) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (timestamp, raw_text, summary, flashcards_json, raw_text[:PREVIEW_CHARS]),
+        )
+        return cur.lastrowid
+
+
+def get_notes_page(before_id: Optional[int] = None, limit: int = 50) -> List[Tuple]:
+    """
+    (id, timestamp, preview) for up to `limit` notes, newest first,
+    starting below `before_id` (keyset pagination: cost doesn't grow
+    with how far back the page is). Served from idx_notes_history.
+    """
+    with connection() as conn:
+        if before_id is None:
+            return conn.execute(
+                "SELECT id, timestamp, preview FROM notes ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return conn.execute(
+            "SELECT id, timestamp, preview FROM notes WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id, limit),
+        ).fetchall()
 
 
 def get_note_by_id(note_id: int) -> Optional[Tuple]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, timestamp, raw_text, summary, flashcards_json FROM notes WHERE id = ?",
-        (note_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, timestamp, raw_text, summary, flashcards_json FROM notes WHERE id = ?",
+            (note_id,),
+        ).fetchone()
+
+
+def get_notes_after(note_id: int) -> List[Tuple]:
+    """(id, raw_text) for every note with id > note_id, oldest first."""
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, raw_text FROM notes WHERE id > ? ORDER BY id",
+            (note_id,),
+        ).fetchall()
+
+
+def get_note_texts(note_ids: List[int]) -> Dict[int, str]:
+    if not note_ids:
+        return {}
+    placeholders = ",".join("?" * len(note_ids))
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT id, raw_text FROM notes WHERE id IN ({placeholders})",
+            list(note_ids),
+        ).fetchall()
+    return {note_id: raw_text for note_id, raw_text in rows}
+
+
+# Snippet highlight markers: control characters that can't occur in notes,
+# so callers can escape the text and then turn these into markup
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+_MIN_PREFIX = 3  # shorter prefixes expand to too many terms to be useful
+
+def _fts_query(text: str) -> str:
+    """
+    User input as an FTS5 query: every word must match, the last one as a
+    prefix (search-as-you-type) once it has _MIN_PREFIX characters. Words
+    are quoted, so FTS5 syntax characters in the input are searched for
+    rather than parsed.
+    """
+    terms = [f'"{t.replace(chr(34), chr(34) * 2)}"' for t in text.split()]
+    if terms and len(text.split()[-1]) >= _MIN_PREFIX:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_notes(text: str, limit: int = 20, offset: int = 0) -> List[Tuple]:
+    """
+    (id, timestamp, snippet, score) for notes matching `text`, best first
+    (bm25 rank; lower score = better). Snippets mark matches with
+    MATCH_START / MATCH_END.
+
+    Ranks ids first and builds snippets only for the returned page, so
+    a broad query doesn't pay for a snippet per match.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+    with connection() as conn:
+        ranked = conn.execute(
+            "SELECT rowid, rank FROM notes_fts WHERE notes_fts MATCH ? "
+            "ORDER BY rank LIMIT ? OFFSET ?",
+            (query, limit, offset),
+        ).fetchall()
+        if not ranked:
+            return []
+
+        ids = [note_id for note_id, _ in ranked]
+        placeholders = ",".join("?" * len(ids))
+        snippets = dict(conn.execute(
+            f"SELECT rowid, snippet(notes_fts, -1, ?, ?, '…', 16) FROM notes_fts "
+            f"WHERE notes_fts MATCH ? AND rowid IN ({placeholders})",
+            (MATCH_START, MATCH_END, query, *ids),
+        ).fetchall())
+        timestamps = dict(conn.execute(
+            f"SELECT id, timestamp FROM notes WHERE id IN ({placeholders})", ids
+        ).fetchall())
+    return [(note_id, timestamps.get(note_id), snippets.get(note_id, ""), score)
+            for note_id, score in ranked]
 
 
 def delete_note(note_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM notes WHERE id = ?", (note_id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+
+
+# ----- Background jobs ----- #
+
+def create_job(job_id: str, created: str, raw_text: str,
+               filename: Optional[str], upload: Optional[bytes]) -> None:
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, stage, created, raw_text, filename, upload) "
+            "VALUES (?, 'queued', 'queued', ?, ?, ?, ?)",
+            (job_id, created, raw_text, filename, upload),
+        )
+
+
+def claim_next_job(started: str) -> Optional[Tuple]:
+    """
+    Atomically move the oldest queued job to 'running'.
+    Returns (id, raw_text, filename, upload) or None.
+    """
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT id, raw_text, filename, upload FROM jobs "
+            "WHERE status = 'queued' ORDER BY created, rowid LIMIT 1"
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'started', started = ?, heartbeat = ? "
+                "WHERE id = ?",
+                (started, started, row[0]),
+            )
+    return row
+
+
+def update_job_stage(job_id: str, stage: str, now: str) -> None:
+    with connection() as conn:
+        conn.execute("UPDATE jobs SET stage = ?, heartbeat = ? WHERE id = ?", (stage, now, job_id))
+
+
+def touch_jobs(job_ids: List[str], now: str) -> None:
+    """Heartbeat for jobs this process is still running."""
+    with connection() as conn:
+        conn.executemany(
+            "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+            [(now, job_id) for job_id in job_ids],
+        )
+
+
+def finish_job(job_id: str, status: str, finished: str,
+               result_json: Optional[str], error: Optional[str]) -> None:
+    """Record the outcome and drop the stored upload."""
+    with connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, finished = ?, result_json = ?, error = ?, "
+            "upload = NULL WHERE id = ?",
+            (status, status, finished, result_json, error, job_id),
+        )
+
+
+def get_job(job_id: str) -> Optional[Tuple]:
+    with connection() as conn:
+        return conn.execute(
+            "SELECT id, status, stage, created, started, finished, result_json, error "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+
+
+def count_jobs_by_status() -> Dict[str, int]:
+    with connection() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def requeue_stale_jobs(heartbeat_before: str) -> int:
+    """
+    Put jobs left 'running' by a crashed or restarted process back in the
+    queue: those whose heartbeat stopped before the cutoff.
+    """
+    with connection() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'queued', stage = 'queued' "
+            "WHERE status = 'running' AND coalesce(heartbeat, started) < ?",
+            (heartbeat_before,),
+        )
+        return cur.rowcount
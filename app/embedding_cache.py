@@ -0,0 +1,140 @@
+# embedding_cache.py
+"""
+Content-addressed cache for sentence embeddings.
+
+- Key: blake2b of model name + whitespace-normalised text
+- Tier 1: bounded in-memory LRU
+- Tier 2 (optional): SQLite file at EMBED_CACHE_PATH, survives restarts
+- Hit/miss counters are available from cache_stats()
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from app.config import EMBED_CACHE_PATH, EMBED_CACHE_SIZE
+
+_lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+
+def text_key(model_name: str, text: str) -> bytes:
+    normalized = " ".join(text.split())
+    return hashlib.blake2b(
+        f"{model_name}\0{normalized}".encode("utf-8"), digest_size=16
+    ).digest()
+
+
+# ---------- disk tier ----------
+
+def _disk_conn():
+    conn = sqlite3.connect(EMBED_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB)"
+    )
+    return conn
+
+
+def _disk_get(keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+    if not EMBED_CACHE_PATH or not keys:
+        return {}
+    try:
+        conn = _disk_conn()
+        placeholders = ",".join("?" * len(keys))
+        rows = conn.execute(
+            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        conn.close()
+    except Exception as e:
+        print("Embedding cache read failed:", e)
+        return {}
+    return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+
+def _disk_put(items: Dict[bytes, np.ndarray]) -> None:
+    if not EMBED_CACHE_PATH or not items:
+        return
+    try:
+        conn = _disk_conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, vec.astype(np.float32).tobytes()) for key, vec in items.items()],
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print("Embedding cache write failed:", e)
+
+
+# ---------- memory tier ----------
+
+def _remember(key: bytes, vec: np.ndarray) -> None:
+    """Insert under _lock, evicting the least recently used entries."""
+    _lru[key] = vec
+    _lru.move_to_end(key)
+    while len(_lru) > EMBED_CACHE_SIZE:
+        _lru.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+# ---------- public API ----------
+
+def encode_cached(
+    model_name: str,
+    texts: List[str],
+    encode: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """
+    Return one embedding row per text, calling encode() only for texts
+    that are in neither tier. Duplicates within a batch are encoded once.
+    """
+    keys = [text_key(model_name, t) for t in texts]
+    found: Dict[bytes, np.ndarray] = {}
+
+    with _lock:
+        for key in keys:
+            vec = _lru.get(key)
+            if vec is not None:
+                _lru.move_to_end(key)
+                found[key] = vec
+                _stats["memory_hits"] += 1
+
+    missing = [k for k in dict.fromkeys(keys) if k not in found]
+    from_disk = _disk_get(missing)
+    found.update(from_disk)
+
+    to_encode: Dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            to_encode.setdefault(key, text)
+
+    encoded: Dict[bytes, np.ndarray] = {}
+    if to_encode:
+        vecs = encode(list(to_encode.values()))
+        encoded = dict(zip(to_encode.keys(), vecs))
+        found.update(encoded)
+        _disk_put(encoded)
+
+    with _lock:
+        _stats["disk_hits"] += len(from_disk)
+        _stats["misses"] += len(encoded)
+        for key, vec in {**from_disk, **encoded}.items():
+            _remember(key, vec)
+
+    return np.stack([found[k] for k in keys])
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_lru)
+    stats["capacity"] = EMBED_CACHE_SIZE
+    stats["disk_enabled"] = bool(EMBED_CACHE_PATH)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+    return stats
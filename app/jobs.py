@@ -0,0 +1,172 @@
+# jobs.py
+"""
+Background processing for /api/jobs.
+
+- submit_job() stores the note (and any upload) in the SQLite jobs table
+  and returns a job id straight away
+- JOB_WORKERS threads claim queued jobs one at a time and run the same
+  pipeline as /api/process-note, recording the current stage as they go
+- The queue is bounded (JOB_MAX_QUEUED) so bursts are absorbed without
+  unbounded growth; queue depth is reported by job_stats()
+
+Because jobs live in SQLite, several app processes can share the queue
+and queued work survives a restart. Each process heartbeats the jobs it
+is running; a 'running' job whose heartbeat is older than JOB_STALE_S
+(its process died) is put back in the queue by any live process.
+
+Workers are started by start_workers(): main.py calls it, and app.app
+does on import only with START_JOB_WORKERS=1 (for WSGI servers).
+"""
+
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.config import JOB_MAX_QUEUED, JOB_STALE_S, JOB_WORKERS
+from app.database import (
+    claim_next_job, count_jobs_by_status, create_job, finish_job,
+    get_job, requeue_stale_jobs, touch_jobs, update_job_stage,
+)
+from app.pipeline import process_note_events
+
+_POLL_S = 1.0  # also picks up jobs submitted by other processes
+_HEARTBEAT_S = max(1.0, min(30.0, JOB_STALE_S / 4))
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_running = set()  # ids of the jobs this process is working on
+_running_lock = threading.Lock()
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _run_job(job_id, raw_text, filename, upload) -> None:
+    upload_arg = (filename, bytes(upload)) if filename else None
+    try:
+        for event, data in process_note_events(raw_text or "", upload_arg):
+            if event == "stage":
+                update_job_stage(job_id, data["stage"], _now())
+            elif event == "result":
+                finish_job(job_id, "done", _now(), json.dumps(data), None)
+                return
+            elif event == "error":
+                finish_job(job_id, "failed", _now(), None, data["error"])
+                return
+        finish_job(job_id, "failed", _now(), None, "Pipeline produced no result")
+    except Exception as e:
+        print("🔥 ERROR in job", job_id, type(e), str(e))
+        finish_job(job_id, "failed", _now(), None, "AI failed to process the note")
+
+
+def _worker_loop() -> None:
+    while True:
+        # Clear before claiming, so a submit that lands meanwhile still wakes us.
+        _wakeup.clear()
+        try:
+            job = claim_next_job(_now())
+        except Exception as e:
+            print("Job claim failed:", e)
+            job = None
+
+        if job is None:
+            _wakeup.wait(_POLL_S)
+            continue
+
+        with _running_lock:
+            _running.add(job[0])
+        try:
+            _run_job(*job)
+        finally:
+            with _running_lock:
+                _running.discard(job[0])
+
+
+def _requeue_stale() -> None:
+    cutoff = (datetime.now() - timedelta(seconds=JOB_STALE_S)).isoformat(timespec="seconds")
+    requeued = requeue_stale_jobs(cutoff)
+    if requeued:
+        print(f"[jobs] Requeued {requeued} stale job(s)")
+        _wakeup.set()
+
+
+def _heartbeat_loop() -> None:
+    """Keep this process's running jobs fresh and reclaim those of dead ones."""
+    while True:
+        time.sleep(_HEARTBEAT_S)
+        try:
+            with _running_lock:
+                running = list(_running)
+            if running:
+                touch_jobs(running, _now())
+            _requeue_stale()
+        except Exception as e:
+            print("Job heartbeat failed:", e)
+
+
+def start_workers(count: int = JOB_WORKERS) -> None:
+    """Start the worker and heartbeat threads once per process; requeues stale jobs first."""
+    with _workers_lock:
+        if _workers or count <= 0:
+            return
+        _requeue_stale()
+        t = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+        t.start()
+        for i in range(count):
+            t = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def submit_job(raw_text: str = "", upload=None) -> str:
+    """Queue a note for processing. Raises QueueFullError when at capacity."""
+    if count_jobs_by_status().get("queued", 0) >= JOB_MAX_QUEUED:
+        raise QueueFullError(f"Job queue is full ({JOB_MAX_QUEUED} waiting). Try again shortly.")
+
+    job_id = uuid.uuid4().hex
+    filename, data = upload if upload else (None, None)
+    create_job(job_id, _now(), raw_text, filename, data)
+    _wakeup.set()
+    return job_id
+
+
+def job_status(job_id: str):
+    """Job as a JSON-ready dict, or None if unknown."""
+    row = get_job(job_id)
+    if row is None:
+        return None
+
+    _, status, stage, created, started, finished, result_json, error = row
+    job = {
+        "job_id": job_id,
+        "status": status,
+        "stage": stage,
+        "created": created,
+        "started": started,
+        "finished": finished,
+    }
+    if result_json:
+        job["result"] = json.loads(result_json)
+    if error:
+        job["error"] = error
+    return job
+
+
+def job_stats() -> dict:
+    counts = count_jobs_by_status()
+    return {
+        "queue_depth": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "workers": len(_workers),
+        "max_queued": JOB_MAX_QUEUED,
+    }
@@ -1,30 +1,127 @@
 import os
 import json
 import re
-from openai import OpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, DefaultHttpxClient, Timeout
+
+try:
+    import httpx
+except ImportError:  # newer openai releases ship on httpx2
+    import httpx2 as httpx
+
+from app import llm_cache
+from app.config import (
+    LLM_MODE, LLM_THREADS, LLM_POOL_SIZE, LLM_TIMEOUT_S,
+    LLM_CONNECT_TIMEOUT_S, LLM_MAX_RETRIES, LLM_STREAM_USAGE,
+)
+from app.tokens import cost_usd, count_messages, count_tokens, fit_context
+
+# Runs summary + flashcards side by side (two threads per in-flight note)
+_executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
 
 # ------------------------------
 # Shared Client
 # ------------------------------
+_client = None
+_client_lock = threading.Lock()
+
+
 def get_client():
-    api_key = os.getenv("OPENAI_API_KEY")
-    base = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
+    """
+    Process-wide OpenAI client. Its HTTP pool keeps connections alive across
+    calls and threads (no TLS handshake per request); 429s and 5xx responses
+    are retried by the SDK with exponential backoff, honouring Retry-After.
+    """
+    global _client
+    if _client is not None:
+        return _client
 
-    if not api_key:
-        raise ValueError("Missing API key. Set OPENAI_API_KEY in .env.")
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            base = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
 
-    return OpenAI(api_key=api_key, base_url=base)
+            if not api_key:
+                raise ValueError("Missing API key. Set OPENAI_API_KEY in .env.")
 
-# ------------------------------
-# Summary (Nova-safe)
-# ------------------------------
-def generate_summary(note_text, context_chunks):
-    client = get_client()
-    model = os.getenv("OPENAI_MODEL", "amazon/nova-2-lite-v1:free")
+            timeout = Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+            http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_SIZE,
+                    max_keepalive_connections=LLM_POOL_SIZE,
+                ),
+                timeout=timeout,
+            )
+            _client = OpenAI(
+                api_key=api_key,
+                base_url=base,
+                timeout=timeout,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+    return _client
+
+
+def reset_client():
+    """Close the pooled client; the next get_client() builds a fresh one."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
 
-    context = "\n\n".join(context_chunks)
 
-    prompt = f"""
+def _parse_json_object(content):
+    """Best-effort parse of a JSON object out of model output (or None)."""
+    # ---- CLEANING LAYER ----
+    # Strip code fences & markdown
+    content = content.replace("```json", "").replace("```", "").strip()
+
+    # Extract only the JSON object
+    match = re.search(r"{[\s\S]*}", content)
+    if match:
+        content = match.group(0).strip()
+
+    # ---- PARSING ----
+    try:
+        return json.loads(content)
+    except Exception:
+        return None
+
+_QA_SPLIT = re.compile(r"^\s*(?:Q(?:uestion)?\s*[:.)-])?\s*(.+?)\s+A(?:nswer)?\s*[:.)-]\s*(.+)$", re.S | re.I)
+
+
+def _clean_flashcards(cards):
+    """
+    Model flashcards as [{"question": str, "answer": str}], whatever shape
+    they came in: "Q: ... A: ..." strings are split, anything else without
+    both parts is dropped. Returns [] if nothing usable is left.
+    """
+    if isinstance(cards, dict):
+        cards = [cards]
+    if not isinstance(cards, list):
+        return []
+
+    clean = []
+    for card in cards:
+        if isinstance(card, dict):
+            question, answer = card.get("question"), card.get("answer")
+        elif isinstance(card, str) and _QA_SPLIT.match(card):
+            question, answer = _QA_SPLIT.match(card).groups()
+        else:
+            continue
+        if question and answer:
+            clean.append({"question": str(question).strip(), "answer": str(answer).strip()})
+    return clean
+
+# ------------------------------
+# Prompt templates
+# (filled with str.format; also hashed into LLM cache keys)
+# ------------------------------
+SUMMARY_SYSTEM = "You summarize academic notes cleanly."
+SUMMARY_PROMPT = """
 Summarize the student's notes into 3–7 bullet points. 
 Do NOT include markdown code fences. 
 Do NOT add headings, titles, or commentary.
@@ -36,38 +133,40 @@ Notes:
 {note_text}
 """
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You summarize academic notes cleanly."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+FLASHCARDS_SYSTEM = "Output ONLY a JSON object following the schema."
+FLASHCARDS_PROMPT = """
+You MUST output valid JSON. Nothing except JSON.
 
-    summary = resp.choices[0].message.content or ""
-    # Remove accidental code fences/output
-    summary = summary.replace("```", "").strip()
+JSON Format:
+{{
+  "flashcards": [
+    {{ "question": "string", "answer": "string" }},
+    {{ "question": "string", "answer": "string" }}
+  ]
+}}
 
-    return summary, {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "cost_usd": 0,
-    }
+Rules:
+- Do NOT include markdown code fences.
+- Do NOT include explanations.
+- Do NOT include commentary.
+- Output ONLY the JSON object.
 
-# ------------------------------
-# Flashcards (Nova-safe)
-# ------------------------------
-def generate_flashcards(note_text, context_chunks):
-    client = get_client()
-    model = os.getenv("OPENAI_MODEL", "amazon/nova-2-lite-v1:free")
+Generate 5–10 flashcards.
 
-    context = "\n\n".join(context_chunks)
+Context:
+{context}
 
-    prompt = f"""
+Notes:
+{note_text}
+"""
+
+COMBINED_SYSTEM = "Output ONLY a JSON object following the schema."
+COMBINED_PROMPT = """
 You MUST output valid JSON. Nothing except JSON.
 
 JSON Format:
 {{
+  "summary": ["bullet point", "bullet point"],
   "flashcards": [
     {{ "question": "string", "answer": "string" }},
     {{ "question": "string", "answer": "string" }}
@@ -75,13 +174,12 @@ JSON Format:
 }}
 
 Rules:
+- "summary" holds 3–7 bullet points summarizing the student's notes.
+- "flashcards" holds 5–10 flashcards.
 - Do NOT include markdown code fences.
-- Do NOT include explanations.
-- Do NOT include commentary.
+- Do NOT include explanations or commentary.
 - Output ONLY the JSON object.
 
-Generate 5–10 flashcards.
-
 Context:
 {context}
 
@@ -89,33 +187,103 @@ Notes:
 {note_text}
 """
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Output ONLY a JSON object following the schema."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+
+def _model_name():
+    return os.getenv("OPENAI_MODEL", "amazon/nova-2-lite-v1:free")
+
+
+def _messages(system, template, note_text, context_chunks, model):
+    """
+    Chat messages for one call, with the context trimmed to the prompt
+    budget. Returns (messages, chunks actually sent, fit stats).
+    """
+    bare = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": template.format(context="", note_text=note_text)},
+    ]
+    chunks, fit = fit_context(context_chunks, count_messages(bare, model), model)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": template.format(context="\n\n".join(chunks), note_text=note_text)},
+    ]
+    return messages, chunks, fit
+
+
+def _usage(model, messages=None, output="", reported=None, context=None, cached=False):
+    """
+    Tokens and cost of one call. Uses the response's `usage` when there is
+    one, otherwise counts locally ("estimated"); cache hits cost nothing.
+    """
+    usage = {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost_usd": 0.0,
+        "cached": cached,
+        "estimated": False,
+        "context": context or {},
+    }
+    if cached:
+        return usage
+
+    if reported is not None and reported.prompt_tokens is not None:
+        usage["prompt_tokens"] = reported.prompt_tokens
+        usage["completion_tokens"] = reported.completion_tokens or 0
+    else:
+        usage["prompt_tokens"] = count_messages(messages or [], model)
+        usage["completion_tokens"] = count_tokens(output, model)
+        usage["estimated"] = True
+
+    # OpenRouter reports what it actually billed; otherwise use the price table
+    billed = getattr(reported, "cost", None)
+    usage["cost_usd"] = float(billed) if billed is not None else cost_usd(
+        model, usage["prompt_tokens"], usage["completion_tokens"])
+    return usage
+
+# ------------------------------
+# Summary (Nova-safe)
+# ------------------------------
+def generate_summary(note_text, context_chunks):
+    model = _model_name()
+    messages, chunks, fit = _messages(SUMMARY_SYSTEM, SUMMARY_PROMPT, note_text, context_chunks, model)
+    cache_key = llm_cache.make_key("summary", model, SUMMARY_SYSTEM + SUMMARY_PROMPT,
+                                   note_text, chunks)
+    hit = llm_cache.get(cache_key)
+    if hit is not None:
+        return hit["summary"], _usage(model, context=fit, cached=True)
+
+    client = get_client()
+    resp = client.chat.completions.create(model=model, messages=messages)
 
     content = resp.choices[0].message.content or ""
+    # Remove accidental code fences/output
+    summary = content.replace("```", "").strip()
 
-    # ---- CLEANING LAYER ----
-    # Strip code fences & markdown
-    content = content.replace("```json", "").replace("```", "").strip()
+    if summary:
+        llm_cache.put(cache_key, {"summary": summary})
 
-    # Extract only the JSON object
-    match = re.search(r"{[\s\S]*}", content)
-    if match:
-        content = match.group(0).strip()
+    return summary, _usage(model, messages, content, resp.usage, fit)
 
-    # ---- PARSING ----
-    try:
-        data = json.loads(content)
-    except Exception:
-        data = None
+# ------------------------------
+# Flashcards (Nova-safe)
+# ------------------------------
+def generate_flashcards(note_text, context_chunks):
+    model = _model_name()
+    messages, chunks, fit = _messages(FLASHCARDS_SYSTEM, FLASHCARDS_PROMPT, note_text, context_chunks, model)
+    cache_key = llm_cache.make_key("flashcards", model, FLASHCARDS_SYSTEM + FLASHCARDS_PROMPT,
+                                   note_text, chunks)
+    hit = llm_cache.get(cache_key)
+    if hit is not None and _clean_flashcards(hit["flashcards"]):
+        return _clean_flashcards(hit["flashcards"]), _usage(model, context=fit, cached=True)
+
+    client = get_client()
+    resp = client.chat.completions.create(model=model, messages=messages)
+
+    content = resp.choices[0].message.content or ""
+    data = _parse_json_object(content)
+    cards = _clean_flashcards(data.get("flashcards")) if isinstance(data, dict) else []
 
     # ---- FALLBACK ----
-    if not data or "flashcards" not in data:
+    if not cards:
         data = {
             "flashcards": [
                 {
@@ -124,9 +292,176 @@ Notes:
                 }
             ]
         }
+    else:
+        # Only real model output is worth replaying
+        data = {"flashcards": cards}
+        llm_cache.put(cache_key, data)
 
-    return data["flashcards"], {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "cost_usd": 0,
+    return data["flashcards"], _usage(model, messages, content, resp.usage, fit)
+
+# ------------------------------
+# Summary, token-streamed
+# ------------------------------
+def stream_summary(note_text, context_chunks):
+    """
+    Same prompt as generate_summary, requested with stream=True.
+    Yields text deltas as they arrive; the generator's return value is
+    (summary, usage) with the cleaned-up full summary. Token counts come
+    from the stream's final usage chunk (LLM_STREAM_USAGE).
+    """
+    model = _model_name()
+    messages, chunks, fit = _messages(SUMMARY_SYSTEM, SUMMARY_PROMPT, note_text, context_chunks, model)
+    cache_key = llm_cache.make_key("summary", model, SUMMARY_SYSTEM + SUMMARY_PROMPT,
+                                   note_text, chunks)
+    hit = llm_cache.get(cache_key)
+    if hit is not None:
+        yield hit["summary"]
+        return hit["summary"], _usage(model, context=fit, cached=True)
+
+    client = get_client()
+    extra = {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+    parts = []
+    reported = None
+    # Closing the stream (also when the generator is closed early, e.g. the
+    # SSE client went away) hands its connection back to the pool
+    with client.chat.completions.create(model=model, messages=messages, stream=True, **extra) as stream:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                reported = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+    # Remove accidental code fences/output
+    content = "".join(parts)
+    summary = content.replace("```", "").strip()
+    if summary:
+        llm_cache.put(cache_key, {"summary": summary})
+
+    return summary, _usage(model, messages, content, reported, fit)
+
+# ------------------------------
+# Summary + flashcards in one call
+# ------------------------------
+def generate_combined(note_text, context_chunks):
+    """
+    One round-trip returning both outputs. Returns (None, None, usage) if the
+    model's JSON is unusable, so the caller can fall back to separate calls.
+    """
+    model = _model_name()
+    messages, chunks, fit = _messages(COMBINED_SYSTEM, COMBINED_PROMPT, note_text, context_chunks, model)
+    cache_key = llm_cache.make_key("combined", model, COMBINED_SYSTEM + COMBINED_PROMPT,
+                                   note_text, chunks)
+    hit = llm_cache.get(cache_key)
+    if hit is not None and _clean_flashcards(hit["flashcards"]):
+        return hit["summary"], _clean_flashcards(hit["flashcards"]), _usage(model, context=fit, cached=True)
+
+    client = get_client()
+    resp = client.chat.completions.create(model=model, messages=messages)
+
+    content = resp.choices[0].message.content or ""
+    usage = _usage(model, messages, content, resp.usage, fit)
+
+    data = _parse_json_object(content)
+    cards = _clean_flashcards(data.get("flashcards")) if isinstance(data, dict) else []
+    if not cards or not data.get("summary"):
+        return None, None, usage
+
+    summary = data["summary"]
+    if isinstance(summary, list):
+        summary = "\n".join(f"- {str(b).lstrip('-• ').strip()}" for b in summary)
+    summary = str(summary).replace("```", "").strip()
+
+    llm_cache.put(cache_key, {"summary": summary, "flashcards": cards})
+    return summary, cards, usage
+
+
+# ------------------------------
+# Both outputs for process_note
+# ------------------------------
+def _timed(fn, *args):
+    t0 = time.time()
+    result = fn(*args)
+    return result, int((time.time() - t0) * 1000)
+
+
+def _sum_usage(*usages):
+    total = {
+        key: sum(u.get(key, 0) for u in usages)
+        for key in ("prompt_tokens", "completion_tokens", "cost_usd")
     }
+    total["estimated"] = any(u.get("estimated") for u in usages)
+    # Every call trims the same passages against the same budget
+    total["context"] = next((u["context"] for u in usages if u.get("context")), {})
+    return total
+
+
+def generate_study_material(note_text, context_chunks, mode=None):
+    """
+    Summary + flashcards for one note.
+
+    mode (default LLM_MODE from config):
+      - "concurrent": both calls in flight at once (latency = slower call)
+      - "combined":   one call returning both; falls back to concurrent
+                      if the JSON comes back unusable
+      - "sequential": one after the other
+
+    Returns (summary, flashcards, usage). usage has summed prompt/completion
+    tokens and cost (including a failed combined call), "estimated" (some
+    call had no usage in its response), "context" (how the retrieved
+    passages were fitted to the prompt budget), "cached" (every output came
+    from the LLM cache), and "calls": per-call latency_ms keyed by call name.
+    """
+    mode = mode or LLM_MODE
+
+    if mode == "combined":
+        (summary, flashcards, usage), ms = _timed(generate_combined, note_text, context_chunks)
+        if summary is not None:
+            return summary, flashcards, {**usage, "mode": mode, "calls": {"combined": ms}}
+        print("Combined LLM output unusable; falling back to separate calls")
+        summary, flashcards, fallback = generate_study_material(note_text, context_chunks, mode="concurrent")
+        # The unusable combined call was still billed
+        total = _sum_usage(fallback, usage)
+        fallback.update(total, cached=False)
+        fallback["calls"]["combined"] = ms
+        return summary, flashcards, fallback
+
+    if mode == "sequential":
+        (summary, usage_sum), sum_ms = _timed(generate_summary, note_text, context_chunks)
+        (flashcards, usage_cards), cards_ms = _timed(generate_flashcards, note_text, context_chunks)
+    else:
+        mode = "concurrent"
+        sum_future = _executor.submit(_timed, generate_summary, note_text, context_chunks)
+        cards_future = _executor.submit(_timed, generate_flashcards, note_text, context_chunks)
+        (summary, usage_sum), sum_ms = sum_future.result()
+        (flashcards, usage_cards), cards_ms = cards_future.result()
+
+    usage = _sum_usage(usage_sum, usage_cards)
+    usage["cached"] = usage_sum["cached"] and usage_cards["cached"]
+    usage["mode"] = mode
+    usage["calls"] = {"summary": sum_ms, "flashcards": cards_ms}
+    return summary, flashcards, usage
+
+
+def stream_study_material(note_text, context_chunks):
+    """
+    Streaming variant of generate_study_material: flashcards are requested
+    in the background while summary deltas are yielded as they arrive.
+    Returns (summary, flashcards, usage) as the generator's return value.
+    """
+    cards_future = _executor.submit(_timed, generate_flashcards, note_text, context_chunks)
+
+    t0 = time.time()
+    summary, usage_sum = yield from stream_summary(note_text, context_chunks)
+    sum_ms = int((time.time() - t0) * 1000)
+
+    (flashcards, usage_cards), cards_ms = cards_future.result()
+
+    usage = _sum_usage(usage_sum, usage_cards)
+    usage["cached"] = usage_sum["cached"] and usage_cards["cached"]
+    usage["mode"] = "stream"
+    usage["calls"] = {"summary": sum_ms, "flashcards": cards_ms}
+    return summary, flashcards, usage
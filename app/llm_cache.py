@@ -0,0 +1,40 @@
+# llm_cache.py
+"""
+Persistent cache of LLM responses in SQLite (see sqlite_lru.py).
+
+- Key: sha256 of call kind, model, prompt template, note text and the
+  retrieved context, so a change to any of them is a miss
+- Entries expire after LLM_CACHE_TTL_S seconds
+- Least recently used entries are evicted once the stored responses
+  exceed LLM_CACHE_MAX_MB
+- LLM_CACHE_PATH="" disables the cache
+"""
+
+import hashlib
+import json
+from typing import List, Optional
+
+from app.config import LLM_CACHE_MAX_MB, LLM_CACHE_PATH, LLM_CACHE_TTL_S
+from app.sqlite_lru import SQLiteLRU
+
+_cache = SQLiteLRU(LLM_CACHE_PATH, "llm_cache", ("value",), LLM_CACHE_MAX_MB,
+                   ttl_s=LLM_CACHE_TTL_S, label="LLM cache")
+
+
+def make_key(kind: str, model: str, template: str, note_text: str, context_chunks: List[str]) -> str:
+    template_hash = hashlib.sha256(template.encode("utf-8")).hexdigest()
+    payload = json.dumps([kind, model, template_hash, note_text, list(context_chunks)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[dict]:
+    row = _cache.get(key)
+    return json.loads(row[0]) if row else None
+
+
+def put(key: str, value: dict) -> None:
+    _cache.put(key, json.dumps(value))
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,264 @@
+# metrics.py
+"""
+Rolling request metrics behind /api/metrics and /metrics, fed by
+log_telemetry() as rows are logged (telemetry.csv is never re-read per hit).
+
+- Per pathway, a ring of one row per minute over the last 24 h: a latency
+  histogram (log-spaced buckets 10% apart, so percentiles are within ~5%)
+  plus request, error, token and cost counts.
+- A window ("5m", "1h", "24h") sums the last N minutes; p50/p95/p99 are
+  interpolated inside the bucket the rank falls in.
+- Rows already in telemetry.csv from before this process started are
+  loaded once, on the first snapshot, so windows survive restarts.
+- prometheus_text() gives the usual exposition: counters and a latency
+  histogram since process start, plus windowed percentiles as gauges.
+"""
+
+import csv
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.config import TELEMETRY_BACKUPS, TELEMETRY_FILE
+
+WINDOWS = {"5m": 5, "1h": 60, "24h": 24 * 60}  # minutes
+QUANTILES = (0.5, 0.95, 0.99)
+
+_MINUTES = WINDOWS["24h"]
+# Histogram bucket upper edges in ms: 1 ms .. 10 min, 10% apart (+ overflow)
+_EDGES = np.geomspace(1, 600_000, num=int(math.log(600_000) / math.log(1.1)) + 1)
+# Coarse cumulative buckets for the Prometheus histogram, in seconds
+_PROM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Columns of the per-minute counters
+_REQUESTS, _ERRORS, _TOKENS_IN, _TOKENS_OUT, _COST, _LATENCY_SUM = range(6)
+
+_PREFIX = "studybuddy"
+
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_series = {}
+_started = time.time()
+_history_loaded = False
+
+
+class _Series:
+    """One pathway: the per-minute ring plus lifetime totals."""
+
+    def __init__(self):
+        self.minute = np.full(_MINUTES, -1, dtype=np.int64)  # absolute minute held by each slot
+        self.hist = np.zeros((_MINUTES, len(_EDGES) + 1), dtype=np.int32)
+        self.counts = np.zeros((_MINUTES, 6))
+        self.total = np.zeros(6)
+        self.prom_buckets = [0] * (len(_PROM_BUCKETS) + 1)
+
+    def observe(self, ts, latency_ms, tokens_in, tokens_out, cost, error, lifetime=True):
+        minute = int(ts // 60)
+        slot = minute % _MINUTES
+        if self.minute[slot] != minute:
+            if self.minute[slot] > minute:
+                return  # older than the ring
+            self.minute[slot] = minute
+            self.hist[slot] = 0
+            self.counts[slot] = 0
+
+        row = (1, 1 if error else 0, tokens_in or 0, tokens_out or 0, cost or 0.0, latency_ms or 0)
+        self.counts[slot] += row
+        if latency_ms is not None:
+            self.hist[slot, np.searchsorted(_EDGES, latency_ms)] += 1
+
+        if lifetime:
+            self.total += row
+            if latency_ms is not None:
+                seconds = latency_ms / 1000
+                idx = next((i for i, le in enumerate(_PROM_BUCKETS) if seconds <= le), len(_PROM_BUCKETS))
+                self.prom_buckets[idx] += 1
+
+    def window(self, minutes: int, now: float):
+        """(histogram, counts) summed over the last `minutes` minutes."""
+        current = int(now // 60)
+        live = (self.minute > current - minutes) & (self.minute <= current)
+        return self.hist[live].sum(axis=0), self.counts[live].sum(axis=0)
+
+
+def _percentile(hist: np.ndarray, q: float) -> float | None:
+    """Latency (ms) at quantile q, linear within the bucket holding the rank."""
+    total = int(hist.sum())
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = np.cumsum(hist)
+    idx = int(np.searchsorted(cumulative, rank))
+    idx = min(idx, len(hist) - 1)
+    if idx >= len(_EDGES):
+        return float(_EDGES[-1])  # overflow bucket: a lower bound
+    lower = _EDGES[idx - 1] if idx > 0 else 0.0
+    before = cumulative[idx - 1] if idx > 0 else 0
+    fraction = (rank - before) / hist[idx] if hist[idx] else 1.0
+    return float(lower + (_EDGES[idx] - lower) * fraction)
+
+
+def observe(pathway: str, latency_ms, tokens_in, tokens_out, cost, error, ts: float | None = None) -> None:
+    """Count one request. Called by log_telemetry for every row."""
+    with _lock:
+        series = _series.get(pathway)
+        if series is None:
+            series = _series[pathway] = _Series()
+        series.observe(time.time() if ts is None else ts, latency_ms, tokens_in, tokens_out, cost, error)
+
+
+# ---------- history ----------
+
+def _number(value, kind=float):
+    try:
+        return kind(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _load_history() -> None:
+    """
+    Seed the windows from telemetry.csv (and rotated files young enough to
+    matter) with rows logged before this process started.
+    """
+    oldest = time.time() - _MINUTES * 60
+    paths = [f"{TELEMETRY_FILE}.{n}" for n in range(TELEMETRY_BACKUPS, 0, -1)] + [TELEMETRY_FILE]
+    loaded = 0
+    for path in paths:
+        if not os.path.exists(path) or os.path.getmtime(path) < oldest:
+            continue
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        ts = datetime.fromisoformat(row["timestamp"]).timestamp()
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    # Same-second rows may be live ones; those are counted already
+                    if ts < oldest or ts >= int(_started):
+                        continue
+                    with _lock:
+                        series = _series.setdefault(row.get("pathway") or "unknown", _Series())
+                        series.observe(
+                            ts, _number(row.get("latency_ms")), _number(row.get("tokens_in"), int),
+                            _number(row.get("tokens_out"), int), _number(row.get("cost_usd")),
+                            row.get("error"), lifetime=False,
+                        )
+                    loaded += 1
+        except Exception as e:
+            print("Metrics: could not read", path, e)
+    print(f"[metrics] Loaded {loaded} telemetry rows from the last 24h")
+
+
+def _ensure_history() -> None:
+    global _history_loaded
+    if _history_loaded:
+        return
+    with _load_lock:
+        if not _history_loaded:
+            _load_history()
+            _history_loaded = True
+
+
+# ---------- reports ----------
+
+def _summary(hist: np.ndarray, counts: np.ndarray) -> dict:
+    requests = int(counts[_REQUESTS])
+    latency = {f"p{round(q * 100)}": _percentile(hist, q) for q in QUANTILES}
+    return {
+        "requests": requests,
+        "errors": int(counts[_ERRORS]),
+        "error_rate": round(float(counts[_ERRORS]) / requests, 4) if requests else 0.0,
+        "latency_ms": {
+            **{k: round(v, 1) if v is not None else None for k, v in latency.items()},
+            "mean": round(float(counts[_LATENCY_SUM]) / requests, 1) if requests else None,
+        },
+        "tokens_in": int(counts[_TOKENS_IN]),
+        "tokens_out": int(counts[_TOKENS_OUT]),
+        "cost_usd": round(float(counts[_COST]), 6),
+    }
+
+
+def snapshot(windows=None) -> dict:
+    """
+    {window: {"all": summary, "pathways": {pathway: summary}}} where a
+    summary has requests, errors, error_rate, latency_ms (p50/p95/p99/mean),
+    tokens_in, tokens_out and cost_usd.
+    """
+    _ensure_history()
+    now = time.time()
+    result = {}
+    with _lock:
+        for name in windows or WINDOWS:
+            minutes = WINDOWS[name]
+            all_hist = np.zeros(len(_EDGES) + 1, dtype=np.int64)
+            all_counts = np.zeros(6)
+            pathways = {}
+            for pathway, series in sorted(_series.items()):
+                hist, counts = series.window(minutes, now)
+                if counts[_REQUESTS]:
+                    pathways[pathway] = _summary(hist, counts)
+                all_hist += hist
+                all_counts += counts
+            result[name] = {"all": _summary(all_hist, all_counts), "pathways": pathways}
+    return result
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    """Prometheus text exposition (format 0.0.4)."""
+    windows = snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(str(v))}"' for k, v in labels.items())
+            lines.append(f"{_PREFIX}_{name}{suffix}{{{label_text}}} {value}")
+
+    with _lock:
+        series = sorted((p, s.total.copy(), list(s.prom_buckets)) for p, s in _series.items())
+
+    metric("requests_total", "counter", "Processed notes since process start.",
+           [("", {"pathway": p}, int(t[_REQUESTS])) for p, t, _ in series])
+    metric("request_errors_total", "counter", "Requests that ended in an error.",
+           [("", {"pathway": p}, int(t[_ERRORS])) for p, t, _ in series])
+    metric("tokens_total", "counter", "LLM tokens, by direction.",
+           [("", {"pathway": p, "direction": d}, int(t[col]))
+            for p, t, _ in series for d, col in (("in", _TOKENS_IN), ("out", _TOKENS_OUT))])
+    metric("cost_usd_total", "counter", "LLM cost in USD.",
+           [("", {"pathway": p}, repr(float(t[_COST]))) for p, t, _ in series])
+
+    samples = []
+    for p, t, buckets in series:
+        cumulative = 0
+        for le, count in zip([*map(str, _PROM_BUCKETS), "+Inf"], buckets):
+            cumulative += count
+            samples.append(("_bucket", {"pathway": p, "le": le}, cumulative))
+        samples.append(("_sum", {"pathway": p}, repr(float(t[_LATENCY_SUM]) / 1000)))
+        samples.append(("_count", {"pathway": p}, int(t[_REQUESTS])))
+    metric("request_latency_seconds", "histogram", "End-to-end request latency.", samples)
+
+    samples = []
+    for window, report in windows.items():
+        for p, summary in report["pathways"].items():
+            for key, value in summary["latency_ms"].items():
+                if key != "mean" and value is not None:
+                    quantile = str(int(key[1:]) / 100)
+                    samples.append(("", {"pathway": p, "window": window, "quantile": quantile}, value / 1000))
+    metric("request_latency_window_seconds", "gauge",
+           "Latency quantiles over a rolling window.", samples)
+
+    samples = [("", {"pathway": p, "window": w}, s["error_rate"])
+               for w, report in windows.items() for p, s in report["pathways"].items()]
+    metric("error_rate_window", "gauge", "Share of requests that failed over a rolling window.", samples)
+
+    return "\n".join(lines) + "\n"
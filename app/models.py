@@ -0,0 +1,100 @@
+# models.py
+"""
+Process-wide registry of the heavy ML models.
+
+- Nothing is imported or loaded until a model is first asked for, so
+  importing the app (and every web / job worker) stays fast
+- get_model() is thread-safe: concurrent first callers wait for a single
+  load instead of building the model twice
+- warm_up() loads models ahead of the first request, optionally in a
+  background thread (MODEL_WARMUP in config)
+
+Registered models:
+  "embedder"  SentenceTransformer(EMBEDDING_MODEL), used by rag.py
+  "easyocr"   easyocr.Reader(["en"]) on CPU, used by ocr_utils.py
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+_loaders: Dict[str, Callable[[], object]] = {}
+_models: Dict[str, object] = {}
+_load_locks: Dict[str, threading.Lock] = {}
+_load_ms: Dict[str, int] = {}
+
+
+def register(name: str, loader: Callable[[], object]) -> None:
+    """Add a model under `name`; `loader` runs on first get_model(name)."""
+    _loaders[name] = loader
+    _load_locks[name] = threading.Lock()
+
+
+def get_model(name: str):
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _load_locks[name]:
+        # Another thread may have finished loading while we waited
+        model = _models.get(name)
+        if model is None:
+            t0 = time.time()
+            model = _loaders[name]()
+            _load_ms[name] = int((time.time() - t0) * 1000)
+            print(f"[models] Loaded {name} in {_load_ms[name]} ms")
+            _models[name] = model
+    return model
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def warm_up(names: Optional[Iterable[str]] = None, background: bool = False):
+    """
+    Load the given models (default: all) now rather than on first use.
+    With background=True, returns the loading thread immediately.
+    """
+    names = list(names) if names is not None else list(_loaders)
+
+    def load_all():
+        for name in names:
+            try:
+                get_model(name)
+            except Exception as e:
+                print(f"[models] Warm-up of {name} failed:", e)
+
+    if not background:
+        load_all()
+        return None
+
+    t = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+    t.start()
+    return t
+
+
+def model_stats() -> dict:
+    return {
+        name: {"loaded": name in _models, "load_ms": _load_ms.get(name)}
+        for name in _loaders
+    }
+
+
+# ---------- loaders ----------
+
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def _load_easyocr():
+    import easyocr
+    # English-only, CPU
+    return easyocr.Reader(["en"], gpu=False)
+
+
+register("embedder", _load_embedder)
+register("easyocr", _load_easyocr)
@@ -0,0 +1,34 @@
+# ocr_cache.py
+"""
+Persistent cache of per-page OCR results in SQLite (see sqlite_lru.py).
+
+- Key: sha256 of the page's content and XObject (image / form) streams,
+  its size and rotation, and the rasterization settings, computed by
+  ocr_utils; identical pages hit across documents and uploads
+- Value: the OCR text and the engine that produced it
+- Least recently used entries are evicted once the stored text exceeds
+  OCR_CACHE_MAX_MB
+- OCR_CACHE_PATH="" disables the cache
+"""
+
+from typing import Optional, Tuple
+
+from app.config import OCR_CACHE_MAX_MB, OCR_CACHE_PATH
+from app.sqlite_lru import SQLiteLRU
+
+_cache = SQLiteLRU(OCR_CACHE_PATH, "ocr_cache", ("text", "engine"), OCR_CACHE_MAX_MB,
+                   label="OCR cache")
+
+
+def get(key: str) -> Optional[Tuple[str, str]]:
+    """(text, engine) for a page seen before, else None."""
+    row = _cache.get(key)
+    return (row[0], row[1]) if row else None
+
+
+def put(key: str, text: str, engine: str) -> None:
+    _cache.put(key, text, engine)
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -1,64 +1,232 @@
 # ocr_utils.py
 
+import hashlib
 import io
-from typing import Tuple, List
+import multiprocessing
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import pdfplumber
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import pytesseract
-import easyocr
 import numpy as np
+from PIL import Image
+from pdfminer.pdftypes import resolve1
 
-# English-only, CPU
-easyocr_reader = easyocr.Reader(["en"], gpu=False)
+from app import ocr_cache
+from app.config import (
+    OCR_DESKEW, OCR_DPI, OCR_GRAYSCALE, OCR_MAX_SIDE, OCR_THRESHOLD, OCR_WORKERS,
+)
+from app.models import get_model
+
+_pool = None
+_pool_lock = threading.Lock()
 
 
 # ---------- helpers ----------
 
+# Page classifier thresholds
+_MIN_TEXT_CHARS = 30  # below this, pdfplumber found essentially nothing
+_MIN_QUALITY = 0.5  # text-layer quality score, see _text_quality()
+_INK_OBJECTS = 500  # curves + lines: handwriting / outlined text drawn as vectors
+_MIN_COVERAGE = 0.05  # image share of the page worth OCR'ing on an empty page
+_SMALL_IMAGES = 0.15  # image share below which images are logos / icons
+_LARGE_IMAGES = 0.5  # image share above which images likely hold text
+_CAPTIONED_WORDS = 40  # words that make a medium-image page "diagram + text"
+_OVERLAY = 0.5  # share of chars drawn over images (an OCR'd text layer)
+
+
+def _text_quality(text: str) -> float:
+    """
+    0..1 score for a pdfplumber text layer: the share of characters that
+    aren't unmapped glyphs ("(cid:12)", U+FFFD, control / private-use
+    chars). Digits, punctuation and math symbols are fine: tables and
+    equations are real text too.
+    """
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    bad = 8 * text.count("(cid:") + sum(
+        1 for c in chars if c == "\ufffd" or unicodedata.category(c) in ("Cc", "Co", "Cn")
+    )
+    return max(0.0, 1 - bad / len(chars))
+
+
+def _page_features(page: pdfplumber.page.Page, text: str) -> dict:
+    """What the classifier looks at, also logged with each decision."""
+    area = float(page.width * page.height) or 1.0
+    boxes = []
+    for im in getattr(page, "images", []):
+        x0, x1 = max(im["x0"], 0), min(im["x1"], page.width)
+        top, bottom = max(im["top"], 0), min(im["bottom"], page.height)
+        if x1 > x0 and bottom > top:
+            boxes.append((x0, top, x1, bottom))
+
+    overlay = 0.0
+    chars = page.chars
+    if boxes and chars:
+        cx = np.array([(c["x0"] + c["x1"]) / 2 for c in chars])
+        cy = np.array([(c["top"] + c["bottom"]) / 2 for c in chars])
+        b = np.array(boxes)
+        inside = ((cx[:, None] >= b[:, 0]) & (cx[:, None] <= b[:, 2])
+                  & (cy[:, None] >= b[:, 1]) & (cy[:, None] <= b[:, 3]))
+        overlay = float(inside.any(axis=1).mean())
+
+    return {
+        "text_len": len(text.strip()),
+        "words": len(text.split()),
+        "images": len(boxes),
+        # overlapping images can add up past the page; close enough capped
+        "coverage": round(min(1.0, sum((x1 - x0) * (b1 - t0) for x0, t0, x1, b1 in boxes) / area), 3),
+        "overlay": round(overlay, 3),
+        "ink": len(page.curves) + len(page.lines),
+        "quality": round(_text_quality(text), 3),
+    }
+
+
+def _decide_page(f: dict) -> str:
+    """
+    "text" (pdfplumber is enough), "scanned" (OCR only) or "mixed"
+    (pdfplumber text + OCR), from _page_features().
+    """
+    has_text = f["text_len"] >= _MIN_TEXT_CHARS
+    if has_text and f["quality"] < _MIN_QUALITY:
+        return "scanned"  # garbage text layer: OCR instead
+    if f["ink"] >= _INK_OBJECTS:
+        return "mixed" if has_text else "scanned"
+    if not has_text:
+        return "scanned" if f["coverage"] >= _MIN_COVERAGE else "text"  # else blank page
+    if f["coverage"] < _SMALL_IMAGES or f["overlay"] >= _OVERLAY:
+        return "text"
+    if f["coverage"] < _LARGE_IMAGES and f["words"] >= _CAPTIONED_WORDS:
+        return "text"
+    return "mixed"
+
+
+def _legacy_needs_ocr(f: dict) -> bool:
+    """What the old rule (>150 chars and no images = text) would have done."""
+    return not (f["text_len"] > 150 and f["images"] == 0)
+
+
 def _classify_page(page: pdfplumber.page.Page, text: str) -> str:
     """
     Classify page content type using pdfplumber metadata.
 
     Returns one of: "text", "scanned", "mixed".
     """
-    text_len = len(text.strip())
-    # pdfplumber exposes images as page.images
-    num_images = len(getattr(page, "images", []))
+    return _decide_page(_page_features(page, text))
 
-    if text_len > 150 and num_images == 0:
-        return "text"
-    if text_len < 30 and num_images > 0:
-        return "scanned"
-    return "mixed"
+
+_DESKEW_MAX_DEG = 5.0
+_DESKEW_STEP_DEG = 0.5
+_DESKEW_MAX_POINTS = 200_000
+_ADAPTIVE_BLOCK = 31  # px, odd
+_ADAPTIVE_C = 10  # how much darker than the local mean counts as ink
 
 
-def _preprocess_for_ocr(img):
+def _estimate_skew(gray: np.ndarray) -> float:
     """
-    Light preprocessing to help Tesseract / EasyOCR:
-    grayscale + simple binary threshold.
+    Skew angle (degrees) of the text lines, by projection profile: the
+    angle whose row histogram of dark pixels is most sharply peaked.
     """
-    # pdf2image gives a PIL Image
-    img_gray = img.convert("L")
-    # simple threshold; tweak value if needed
-    img_bin = img_gray.point(lambda x: 0 if x < 180 else 255, "1")
-    return img_bin
-
+    ys, xs = np.nonzero(gray < 128)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > _DESKEW_MAX_POINTS:
+        step = len(ys) // _DESKEW_MAX_POINTS + 1
+        ys, xs = ys[::step], xs[::step]
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-_DESKEW_MAX_DEG, _DESKEW_MAX_DEG + 1e-9, _DESKEW_STEP_DEG):
+        shifted = ys - xs * np.tan(np.radians(angle))
+        rows = np.bincount((shifted - shifted.min()).astype(np.intp))
+        score = float(np.dot(rows, rows))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _adaptive_threshold(gray: np.ndarray) -> np.ndarray:
+    """Ink mask: pixels darker than their local mean by _ADAPTIVE_C (integral image)."""
+    h, w = gray.shape
+    r = _ADAPTIVE_BLOCK // 2
+    dtype = np.int32 if 255 * (h + 1) * (w + 1) < 2**31 else np.int64
+    ii = np.zeros((h + 1, w + 1), dtype=dtype)
+    np.cumsum(gray, axis=0, dtype=dtype, out=ii[1:, 1:])
+    np.cumsum(ii[1:, 1:], axis=1, out=ii[1:, 1:])
+
+    y0 = np.clip(np.arange(h) - r, 0, h)
+    y1 = np.clip(np.arange(h) + r + 1, 0, h)
+    x0 = np.clip(np.arange(w) - r, 0, w)
+    x1 = np.clip(np.arange(w) + r + 1, 0, w)
+    # Window sums from the integral image, one full-size temporary at a time
+    band = np.take(ii, y1, axis=0)
+    band -= np.take(ii, y0, axis=0)  # column prefix sums of each row window
+    del ii
+    sums = np.take(band, x1, axis=1)
+    sums -= np.take(band, x0, axis=1)
+    del band
+
+    # gray < mean - C  <=>  (gray + C) * area < sum, without dividing
+    area = (y1 - y0).astype(dtype)[:, None] * (x1 - x0).astype(dtype)[None, :]
+    area *= np.add(gray, _ADAPTIVE_C, dtype=dtype)
+    return area < sums
+
+
+def _preprocess_for_ocr(img) -> np.ndarray:
+    """
+    Preprocessing to help Tesseract / EasyOCR, done once per page:
+    grayscale, optional downscale (OCR_MAX_SIDE) and deskew (OCR_DESKEW),
+    then a binary threshold (fixed, or adaptive for uneven scans).
 
-def _ocr_tesseract(img) -> str:
+    Returns one 2-D uint8 array (0 = ink, 255 = paper) that both engines
+    read, so the page is not converted again per engine.
+    """
+    # pdf2image gives a PIL Image (already "L" with OCR_GRAYSCALE)
+    if img.mode != "L":
+        img = img.convert("L")
+
+    if OCR_MAX_SIDE and max(img.size) > OCR_MAX_SIDE:
+        factor = -(-max(img.size) // OCR_MAX_SIDE)  # ceil
+        img = img.reduce(factor)
+
+    # One writeable copy of the pixels; everything below works in place
+    gray = np.array(img)
+
+    if OCR_DESKEW:
+        angle = _estimate_skew(gray)
+        if abs(angle) >= _DESKEW_STEP_DEG:
+            rotated = Image.fromarray(gray).rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            gray = np.array(rotated)
+
+    # Paper as True, written as bytes straight into the pixel buffer ...
+    paper = gray.view(np.bool_)
+    if OCR_THRESHOLD == "adaptive":
+        np.logical_not(_adaptive_threshold(gray), out=paper)
+    else:
+        np.greater_equal(gray, 180, out=paper)  # simple threshold; tweak value if needed
+    # ... then scaled 0/1 -> 0/255
+    np.multiply(gray, 255, out=gray)
+    return gray
+
+
+def _ocr_tesseract(arr: np.ndarray) -> str:
     try:
-        processed = _preprocess_for_ocr(img)
-        text = pytesseract.image_to_string(processed)
+        # fromarray shares the buffer for 2-D uint8
+        text = pytesseract.image_to_string(Image.fromarray(arr))
         return text or ""
     except Exception as e:
         print("Tesseract OCR failed:", e)
         return ""
 
 
-def _ocr_easyocr(img) -> str:
+def _ocr_easyocr(arr: np.ndarray) -> str:
     try:
-        processed = _preprocess_for_ocr(img)
-        arr = np.array(processed)
-        results = easyocr_reader.readtext(arr, detail=1, paragraph=True)
+        results = get_model("easyocr").readtext(arr, detail=1, paragraph=True)
     except Exception as e:
         print("EasyOCR failed:", e)
         return ""
@@ -80,93 +248,322 @@ def _ocr_easyocr(img) -> str:
     return "\n".join(lines)
 
 
-# ---------- main API ----------
-
-def extract_text_pdf(pdf_bytes: bytes) -> Tuple[str, str]:
+def _ocr_page(img) -> Tuple[str, str]:
     """
-    Hybrid OCR pipeline for mixed PDFs.
+    Tesseract first (fast); EasyOCR if Tesseract finds next to nothing.
+    Returns (text, engine).
+    """
+    arr = _preprocess_for_ocr(img)
+    tess_text = _ocr_tesseract(arr)
+    if len(tess_text.strip()) > 30:
+        return tess_text, "tesseract"
+    return _ocr_easyocr(arr), "easyocr"
 
-    Per page:
-      1. Try pdfplumber to get digital text.
-      2. Classify page as text / scanned / mixed.
-      3. For scanned/mixed pages, run Tesseract (fast),
-         and fall back to EasyOCR if Tesseract is weak.
-      4. Combine results.
 
-    Returns:
-        (full_text: str, method_used: str)
-        method_used is one of: "pdfplumber", "hybrid_ocr", "empty", or an error tag.
+def _timed_ocr_page(img) -> Tuple[str, str, float]:
+    """_ocr_page plus its wall time in ms, measured where it ran."""
+    t0 = time.perf_counter()
+    text, engine = _ocr_page(img)
+    return text, engine, (time.perf_counter() - t0) * 1000
+
+
+# ---------- parallel OCR ----------
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
     """
-    all_page_text: List[str] = []
-    used_ocr = False
+    Long-lived pool shared by all requests. "spawn" avoids forking a
+    process that may already hold torch / OCR threads. EasyOCR is only
+    loaded in a worker the first time a page falls back to it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool (a worker died) so the next call starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ocr_pages(images: Dict[int, object], workers: int = OCR_WORKERS,
+               timings: Optional[dict] = None) -> Dict[int, Tuple[str, str]]:
+    """
+    OCR {page_index: image}, spreading pages over a process pool when
+    there is more than one. Returns {page_index: (text, engine)}; if
+    given, `timings` gets {page_index: ms} of OCR time per page.
+    """
+    if not images:
+        return {}
 
-    # First pass: inspect pages with pdfplumber
+    indices = sorted(images)
+    results = None
+    if workers > 1 and len(indices) > 1:
+        pool = _get_pool(workers)
+        try:
+            results = list(pool.map(_timed_ocr_page, [images[i] for i in indices]))
+        except BrokenProcessPool as e:
+            print("OCR pool broke, restarting it and falling back to serial:", e)
+            _reset_pool(pool)
+        except Exception as e:
+            print("Parallel OCR failed, falling back to serial:", e)
+    if results is None:
+        results = [_timed_ocr_page(images[i]) for i in indices]
+
+    if timings is not None:
+        timings.update((i, ms) for i, (_, _, ms) in zip(indices, results))
+    return {i: (text, engine) for i, (text, engine, _) in zip(indices, results)}
+
+
+# ---------- rasterization ----------
+
+def _render_page(pdf_bytes: bytes, page_number: int):
+    """Rasterize a single (1-based) page, or None if poppler can't."""
     try:
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            plumber_pages = list(pdf.pages)
-            plumber_texts = []
+        images = convert_from_bytes(
+            pdf_bytes,
+            dpi=OCR_DPI,
+            first_page=page_number,
+            last_page=page_number,
+            grayscale=OCR_GRAYSCALE,
+        )
+    except Exception as e:
+        print(f"pdf2image failed on page {page_number}:", e)
+        return None
+    return images[0] if images else None
 
-            for page in plumber_pages:
-                text = page.extract_text() or ""
-                plumber_texts.append(text)
 
+def _page_count(pdf_bytes: bytes) -> int:
+    """Page count from poppler, for PDFs pdfplumber couldn't open."""
+    try:
+        return int(pdfinfo_from_bytes(pdf_bytes).get("Pages", 0))
     except Exception as e:
-        print("pdfplumber failed during inspection:", e)
-        plumber_pages = []
-        plumber_texts = []
+        print("pdfinfo failed:", e)
+        return 0
+
+
+# ---------- page cache keys ----------
+
+# Bump when OCR output for the same page would change (preprocessing, engines)
+_CACHE_VERSION = 1
 
-    # Second pass: convert to images once (for OCR)
+
+def _cache_prefix() -> str:
+    return (f"v{_CACHE_VERSION}:dpi={OCR_DPI}:gray={OCR_GRAYSCALE}:"
+            f"max={OCR_MAX_SIDE}:deskew={OCR_DESKEW}:thr={OCR_THRESHOLD}:")
+
+
+def _page_key(page) -> Optional[str]:
+    """
+    Hash of what the page draws: its content streams plus every XObject
+    (image / form) it references, and its size and rotation. Lets a
+    repeated page skip rasterization as well as OCR.
+    """
     try:
-        images = convert_from_bytes(pdf_bytes)
+        page_obj = page.page_obj
+        h = hashlib.sha256(_cache_prefix().encode("utf-8"))
+        h.update(f"{page.width}x{page.height}:{page.rotation}".encode("utf-8"))
+        for stream in page_obj.contents or []:
+            h.update(resolve1(stream).get_data())
+        xobjects = resolve1(page_obj.resources.get("XObject")) or {}
+        for name in sorted(xobjects):
+            h.update(str(name).encode("utf-8"))
+            h.update(resolve1(xobjects[name]).get_data())
+        return h.hexdigest()
     except Exception as e:
-        print("pdf2image failed:", e)
-        images = []
-
-    # Ensure we can iterate safely
-    num_pages = max(len(plumber_pages), len(images), len(plumber_texts))
-    for i in range(num_pages):
-        page = plumber_pages[i] if i < len(plumber_pages) else None
-        page_text = plumber_texts[i] if i < len(plumber_texts) else ""
-        img = images[i] if i < len(images) else None
-
-        if page is None:
-            # No pdfplumber page; pure image → OCR
-            if img is not None:
-                used_ocr = True
-                tess_text = _ocr_tesseract(img)
-                if len(tess_text.strip()) > 30:
-                    all_page_text.append(tess_text)
-                else:
-                    easy_text = _ocr_easyocr(img)
-                    all_page_text.append(easy_text)
-            continue
+        print("Could not hash page for the OCR cache:", e)
+        return None
+
 
-        # Classify the page
-        page_type = _classify_page(page, page_text)
-        print(f"[OCR] Page {i+1}: type={page_type}, len(text)={len(page_text.strip())}, images={len(getattr(page, 'images', []))}")
+def _image_key(img) -> str:
+    """Fallback key from rendered pixels, when pdfplumber can't read the page."""
+    h = hashlib.sha256(_cache_prefix().encode("utf-8"))
+    h.update(f"{img.mode}:{img.width}x{img.height}".encode("utf-8"))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def _bump(stats: Optional[dict], key: str) -> None:
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + 1
+
+
+# ---------- main API ----------
+
+def _inspect_page(pdf, index: int, stats: Optional[dict] = None) -> Tuple[str, str]:
+    """
+    (page_type, pdfplumber text) for one page; "scanned" without pdfplumber.
+    Counts decisions in `stats`: pages_<type>, and ocr_skipped for pages
+    the old classifier would have OCR'd.
+    """
+    if pdf is None:
+        # No pdfplumber page; pure image → OCR
+        _bump(stats, "pages_scanned")
+        return "scanned", ""
+
+    page = pdf.pages[index]
+    try:
+        page_text = page.extract_text() or ""
+    except Exception as e:
+        print(f"pdfplumber failed on page {index+1}:", e)
+        page_text = ""
+
+    features = _page_features(page, page_text)
+    page_type = _decide_page(features)
+    print(f"[OCR] Page {index+1}: type={page_type}, {features}")
+
+    _bump(stats, f"pages_{page_type}")
+    if page_type == "text" and _legacy_needs_ocr(features):
+        _bump(stats, "ocr_skipped")
+    if page_type == "scanned" and features["quality"] < _MIN_QUALITY:
+        page_text = ""  # mostly unmapped glyphs: don't mix them into the OCR text
+    return page_type, page_text
+
+
+def _flush_pages(pending, to_ocr, keys, ocr_results, workers: int,
+                 page_ms: dict, stats: Optional[dict] = None):
+    """
+    OCR the batch in parallel, cache the new results, then yield the
+    batch's pages in order. ocr_results already holds the cache hits.
+    """
+    ocr_ms = {}
+    for i, (text, engine) in _ocr_pages(to_ocr, workers, ocr_ms).items():
+        ocr_results[i] = (text, engine)
+        if keys.get(i):
+            ocr_cache.put(keys[i], text, engine)
+
+    for i, page_type, page_text in pending:
+        if stats is not None:
+            page = {"page": i, "type": page_type, "ms": round(page_ms[i] + ocr_ms.get(i, 0), 1)}
+            if i in ocr_results:
+                page["engine"] = ocr_results[i][1]
+                page["cached"] = i not in ocr_ms
+            stats.setdefault("pages", []).append(page)
 
         if page_type == "text":
             # pdfplumber is good enough
-            all_page_text.append(page_text)
+            yield i, page_text, page_type
             continue
 
-        # scanned or mixed → need OCR
-        used_ocr = True
-
         # Start with pdfplumber text if any (for mixed pages)
         combined = page_text.strip()
+        if i in ocr_results:
+            combined = (combined + "\n" + ocr_results[i][0]).strip()
+        yield i, combined, page_type
 
-        if img is not None:
-            tess_text = _ocr_tesseract(img)
-            if len(tess_text.strip()) > 30:
-                combined = (combined + "\n" + tess_text).strip()
-            else:
-                easy_text = _ocr_easyocr(img)
-                combined = (combined + "\n" + easy_text).strip()
 
-        all_page_text.append(combined)
+def iter_pdf_pages(pdf_bytes: bytes, workers: int = OCR_WORKERS,
+                   stats: Optional[dict] = None) -> Iterator[Tuple[int, str, str]]:
+    """
+    Yield (page_index, text, page_type) in page order as pages are done.
+
+    Digital-text pages come out immediately. Pages needing OCR are first
+    looked up in the OCR page cache; misses are rasterized and collected
+    until `workers` of them are pending, then OCR'd together on the pool.
+    Stop iterating (or close the generator) to skip the rest of the
+    document.
+
+    If given, `stats` is filled with page decisions (pages_text /
+    pages_mixed / pages_scanned, ocr_skipped), ocr_cache_hits /
+    ocr_cache_misses, and "pages": one {page, type, ms, engine?, cached?}
+    per page, ms being the time spent on that page (inspection,
+    rasterization and OCR, wherever it ran).
+    """
+    try:
+        pdf = pdfplumber.open(io.BytesIO(pdf_bytes))
+    except Exception as e:
+        print("pdfplumber failed during inspection:", e)
+        pdf = None
+
+    try:
+        num_pages = len(pdf.pages) if pdf is not None else _page_count(pdf_bytes)
+        batch = max(workers, 1)
+        pending, to_ocr, keys, ocr_results, page_ms = [], {}, {}, {}, {}
+
+        for i in range(num_pages):
+            t0 = time.perf_counter()
+            page_type, page_text = _inspect_page(pdf, i, stats)
+            pending.append((i, page_type, page_text))
+
+            if page_type != "text":
+                key = _page_key(pdf.pages[i]) if pdf is not None else None
+                hit = ocr_cache.get(key) if key else None
+                img = None if hit else _render_page(pdf_bytes, i + 1)
+                if img is not None and key is None:
+                    key = _image_key(img)
+                    hit = ocr_cache.get(key)
+
+                if hit:
+                    _bump(stats, "ocr_cache_hits")
+                    ocr_results[i] = hit
+                elif img is not None:
+                    _bump(stats, "ocr_cache_misses")
+                    to_ocr[i] = img
+                    keys[i] = key
+            page_ms[i] = (time.perf_counter() - t0) * 1000
+
+            if page_type != "text":
+                if len(to_ocr) < batch:
+                    continue
+            elif to_ocr:
+                # keep page order: wait for the OCR pages queued before it
+                continue
+
+            yield from _flush_pages(pending, to_ocr, keys, ocr_results, workers, page_ms, stats)
+            pending, to_ocr, keys, ocr_results, page_ms = [], {}, {}, {}, {}
+
+        yield from _flush_pages(pending, to_ocr, keys, ocr_results, workers, page_ms, stats)
+    finally:
+        if pdf is not None:
+            pdf.close()
+
+
+def extract_text_pdf(pdf_bytes: bytes, max_chars: Optional[int] = None,
+                     stats: Optional[dict] = None) -> Tuple[str, str]:
+    """
+    Hybrid OCR pipeline for mixed PDFs.
+
+    Per page:
+      1. Try pdfplumber to get digital text.
+      2. Classify page as text / scanned / mixed.
+      3. For scanned/mixed pages only, reuse a cached result for the same
+         page, or rasterize it and run Tesseract (fast), falling back to
+         EasyOCR if Tesseract is weak.
+      4. Combine results.
+
+    With max_chars, stops reading pages as soon as the text grows past
+    it, so an over-long document returns more than max_chars characters
+    without the rest being OCR'd. `stats` is passed to iter_pdf_pages.
+
+    Returns:
+        (full_text: str, method_used: str)
+        method_used is one of: "pdfplumber", "hybrid_ocr", "empty", or an error tag.
+    """
+    all_page_text: List[str] = []
+    used_ocr = False
+    length = 0
+
+    for _, text, page_type in iter_pdf_pages(pdf_bytes, stats=stats):
+        if page_type != "text":
+            used_ocr = True
+        if not text or not text.strip():
+            continue
+
+        length += len(text) + (2 if all_page_text else 0)  # "\n\n" separator
+        all_page_text.append(text)
+        if max_chars is not None and length > max_chars:
+            print(f"[OCR] Stopped after {len(all_page_text)} page(s) with text: over {max_chars} chars")
+            break
 
-    full_text = "\n\n".join(t for t in all_page_text if t and t.strip())
+    full_text = "\n\n".join(all_page_text)
 
     if not full_text.strip():
         return "", "empty"
@@ -0,0 +1,183 @@
+# pipeline.py
+"""
+The process-note pipeline, shared by the JSON and streaming endpoints:
+
+    upload -> OCR -> guardrails -> RAG context -> LLM -> SQLite -> telemetry
+
+Each step is recorded as a span on the request's Trace (telemetry
+`details["spans"]`), including one per PDF page and one per LLM call.
+
+process_note_events() is a generator of (event, data) pairs:
+  - ("stage",   {"stage": name, ...})  a step finished
+  - ("summary", {"delta": text})       summary tokens (stream_summary=True)
+  - ("result",  {...})                 final payload, same as the JSON API
+  - ("error",   {"error": msg, "status": http_status})
+"""
+
+import json
+import time
+from datetime import datetime
+
+from app.config import UPLOAD_OVERFLOW
+from app.database import save_note
+from app.llm import generate_study_material, stream_study_material
+from app.rag import add_note_to_rag, query_context
+from app.safety import MAX_INPUT_CHARS, validate_user_input
+from app.telemetry import Trace, log_telemetry
+
+
+def extract_text(filename: str, data: bytes, stats=None):
+    """
+    Text of an uploaded .txt / .pdf file. Returns (raw_text, method).
+    PDFs stop being read once past MAX_INPUT_CHARS, since anything longer
+    is rejected or cut anyway; OCR page cache hits/misses go into `stats`.
+    """
+    ext = filename.rsplit(".", 1)[1].lower()
+
+    if ext == "pdf":
+        from app.ocr_utils import extract_text_pdf
+        raw_text, method_used = extract_text_pdf(data, max_chars=MAX_INPUT_CHARS, stats=stats)
+        print("OCR method used:", method_used)
+        return raw_text, method_used
+
+    return data.decode("utf-8", errors="ignore"), "txt"
+
+
+def _log(trace: Trace, pathway, latency_ms, tokens_in, tokens_out, cost, error, details) -> None:
+    details["spans"] = trace.spans
+    log_telemetry(pathway, latency_ms, tokens_in, tokens_out, cost, error, details)
+
+
+def process_note_events(raw_text: str = "", upload=None, stream_summary: bool = False,
+                        trace: Trace | None = None):
+    """
+    Run the pipeline for pasted text, or for upload=(filename, bytes).
+    With stream_summary=True the summary is token-streamed while the
+    flashcards are generated alongside it. Pass `trace` to add spans
+    recorded before the call (e.g. reading the upload).
+    """
+    t_start = time.time()
+    pathway = "rag"
+    details = {}
+    trace = trace or Trace()
+
+    # 1) OCR / decode the upload
+    if upload is not None:
+        filename, data = upload
+        t0 = time.time()
+        with trace.span("ocr", bytes=len(data)) as span:
+            raw_text, method_used = extract_text(filename, data, details)
+            span["method"] = method_used
+        details["ocr_method"] = method_used
+        details["ocr_ms"] = int((time.time() - t0) * 1000)
+        for page in details.pop("pages", []):
+            trace.add("ocr_page", page.pop("ms"), **page)
+
+        # Over the limit: the PDF was only partly read, so its length is a lower bound
+        over_limit = len(raw_text) > MAX_INPUT_CHARS
+        if over_limit and UPLOAD_OVERFLOW == "truncate":
+            raw_text = raw_text[:MAX_INPUT_CHARS]
+            details["ocr_truncated"] = True
+        yield "stage", {"stage": "ocr", "method": method_used, "chars": len(raw_text),
+                        "truncated": details.get("ocr_truncated", False)}
+
+        if over_limit and UPLOAD_OVERFLOW != "truncate":
+            error_message = (
+                f"This file has more than {MAX_INPUT_CHARS} characters of text. "
+                f"Please upload a shorter document."
+            )
+            latency_ms = int((time.time() - t_start) * 1000)
+            _log(trace, pathway, latency_ms, None, None, None, error_message, details)
+            yield "error", {"error": error_message, "status": 400}
+            return
+
+    # 2) Safety guardrails
+    is_valid, error_message = validate_user_input(raw_text)
+    if not is_valid:
+        latency_ms = int((time.time() - t_start) * 1000)
+        _log(trace, pathway, latency_ms, None, None, None, error_message, details)
+        yield "error", {"error": error_message, "status": 400}
+        return
+
+    # 3) Retrieve RAG context using this note as query
+    t0 = time.time()
+    rag_timings = {}
+    with trace.span("retrieve") as span:
+        context_chunks = query_context(query=raw_text, k=4, stats=rag_timings)
+        span["passages"] = len(context_chunks)
+    details["retrieve_ms"] = int((time.time() - t0) * 1000)
+    if rag_timings:
+        trace.add("embed", rag_timings["embed_ms"])
+        trace.add("search", rag_timings["search_ms"])
+    yield "stage", {"stage": "context", "passages": len(context_chunks)}
+
+    try:
+        # 4) LLM: summary + flashcards
+        t_llm = time.time()
+        llm_start = trace.elapsed_ms()
+        if stream_summary:
+            stream = stream_study_material(raw_text, context_chunks)
+            try:
+                while True:
+                    try:
+                        delta = next(stream)
+                    except StopIteration as done:
+                        summary, flashcards, usage = done.value
+                        break
+                    yield "summary", {"delta": delta}
+            finally:
+                stream.close()  # client gone mid-stream: release the LLM connection now
+        else:
+            summary, flashcards, usage = generate_study_material(raw_text, context_chunks)
+        llm_ms = int((time.time() - t_llm) * 1000)
+        trace.add("llm", trace.elapsed_ms() - llm_start, llm_start, mode=usage["mode"])
+        for call, call_ms in usage["calls"].items():
+            trace.add("llm_call", call_ms, call=call)
+        yield "stage", {"stage": "llm", "ms": llm_ms}
+
+        latency_ms = int((time.time() - t_start) * 1000)
+
+        # Served entirely from the LLM response cache: its own pathway
+        if usage.get("cached"):
+            pathway = "cache"
+
+        tokens_in = usage.get("prompt_tokens", 0)
+        tokens_out = usage.get("completion_tokens", 0)
+        cost = round(usage.get("cost_usd", 0.0), 8)
+        details.update({
+            "llm_mode": usage["mode"],
+            "llm_ms": llm_ms,
+            "llm_calls_ms": usage["calls"],
+            "llm_cached": usage.get("cached", False),
+            "tokens_estimated": usage.get("estimated", False),
+            "prompt_context": usage.get("context", {}),
+        })
+
+        # 5) Persist note to SQLite, then add it to the RAG store under its id
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with trace.span("db_write"):
+            note_id = save_note(raw_text, summary, json.dumps(flashcards), timestamp)
+        with trace.span("rag_index"):
+            add_note_to_rag(note_id, raw_text)
+
+        # 6) Telemetry logging
+        _log(trace, pathway, latency_ms, tokens_in, tokens_out, cost, None, details)
+
+        yield "result", {
+            "note_id": note_id,
+            "summary": summary,
+            "flashcards": flashcards,
+            "latency_ms": latency_ms,
+            "llm_calls_ms": usage["calls"],
+            "cached": usage.get("cached", False),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_estimated": usage.get("estimated", False),
+            "cost_usd": cost
+        }
+
+    except Exception as e:
+        print("🔥 ERROR in process_note:", type(e), str(e))
+        latency_ms = int((time.time() - t_start) * 1000)
+        _log(trace, pathway, latency_ms, None, None, None, str(e), details)
+        yield "error", {"error": "AI failed to process the note", "status": 500}
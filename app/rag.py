@@ -1,66 +1,543 @@
 # rag.py
 """
-Lightweight RAG using sentence-transformers + scikit-learn.
+Lightweight RAG using sentence-transformers + NumPy.
 
 - No external DB or chromadb
-- Embeds notes with all-MiniLM-L6-v2
-- Keeps vectors in memory for this session
-- Uses cosine-similarity NearestNeighbors
+- Embeds notes with all-MiniLM-L6-v2 (loaded lazily), through a content-hash cache so a
+  given text is only encoded once
+- Indexes overlapping sentence-window passages rather than whole notes,
+  each row carrying (note_id, start, end) offsets into the note text
+- Keeps vectors in a preallocated float32 matrix that grows by doubling
+  (only the new note's passages are encoded on add)
+- Vectors are L2-normalised, so cosine similarity is a plain dot product
+- The matrix and its id map are memory-mapped .npy files under
+  RAG_STORE_DIR, so a restart reopens them instead of re-encoding; note
+  text itself is read back from SQLite
+- Retrieval returns the top-k passages that fit a token budget; the
+  search itself is done by the backend named in RAG_SEARCH_BACKEND
+  (exact / ivf / hnsw, see vector_search.py)
+- Deleting or editing a note tombstones its rows; once they reach
+  RAG_COMPACT_FRACTION of the store, the live rows are copied into new
+  files and the search backend is rebuilt
+- Several processes can share one store: writes hold an flock on
+  store.lock and first catch up with rows other processes appended (or
+  remap files they grew or compacted); queries catch up when meta.json has changed
 """
 
-from typing import List, Tuple
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single process assumed
+    fcntl = None
+
 import numpy as np
+from numpy.lib.format import open_memmap
+
+from app.chunking import chunk_text, estimate_tokens
+from app.config import (
+    RAG_CHUNK_CHARS, RAG_CHUNK_OVERLAP, RAG_CONTEXT_TOKENS, RAG_STORE_DIR,
+    RAG_SEARCH_BACKEND, RAG_IVF_NPROBE, RAG_HNSW_EF, RAG_COMPACT_FRACTION,
+)
+from app.database import get_note_texts, get_notes_after
+from app.embedding_cache import encode_cached, cache_stats
+from app.models import EMBEDDING_MODEL, get_model
+from app.vector_search import make_backend
+
+MODEL_NAME = EMBEDDING_MODEL  # loaded on first encode, see models.py
+
+_INITIAL_CAPACITY = 1024
+_MIN_COMPACT_ROWS = 256  # don't bother compacting fewer tombstones than this
+_REHYDRATE_BATCH = 64
+
+_VECTORS_FILE = "vectors.npy"
+_ROWS_FILE = "rows.npy"
+_META_FILE = "meta.json"
+_LOCK_FILE = "store.lock"
+_STORE_VERSION = 3  # bump when the row layout changes; old stores are rebuilt
+
+# One entry per matrix row (= one passage). hash is of the whole note text,
+# kept as raw bytes (V16): an "S" field would drop trailing NULs.
+# Deleted notes keep their rows with note_id = -1.
+_ROW_DTYPE = np.dtype([
+    ("note_id", "<i8"),
+    ("start", "<i4"),
+    ("end", "<i4"),
+    ("hash", "V16"),
+])
+
+# Rows [0, _size) are live; the rest is spare capacity.
+_embeddings: np.ndarray | None = None
+_rows: np.ndarray | None = None
+_size = 0
+_row_of: Dict[int, List[int]] = {}  # note_id -> passage rows
+_last_note_id = 0  # highest note id ever indexed, deleted or not
+_dead = 0  # tombstoned rows, over-fetched past at query time
+_store_dir: str | None = None  # None = in-memory only
+_mapped_ino = None  # inode of the vectors file we have mapped
+_meta_seen = None  # (inode, mtime) of the meta.json we last synced with
+_lock = threading.Lock()  # threads; taken before _store_lock
+_train_lock = threading.Lock()  # one backend training at a time, outside _lock
+
+_backend = make_backend(RAG_SEARCH_BACKEND, nprobe=RAG_IVF_NPROBE, ef=RAG_HNSW_EF)
+
+
+def _encode_uncached(texts: List[str]) -> np.ndarray:
+    vecs = get_model("embedder").encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    """Embed texts as unit-length float32 rows."""
+    return encode_cached(MODEL_NAME, texts, _encode_uncached)
+
+
+def _content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _passages(text: str) -> List[Tuple[int, int]]:
+    return chunk_text(text, max_chars=RAG_CHUNK_CHARS, overlap=RAG_CHUNK_OVERLAP)
+
+
+# ---------- storage ----------
+
+def _store_path(name: str) -> str:
+    return os.path.join(_store_dir, name)
+
+
+@contextmanager
+def _store_lock(exclusive: bool = True):
+    """Cross-process lock on the store files, taken under _lock."""
+    if _store_dir is None or fcntl is None:
+        yield
+        return
+    with open(_store_path(_LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _meta_stamp():
+    try:
+        st = os.stat(_store_path(_META_FILE))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _read_meta() -> Optional[dict]:
+    try:
+        with open(_store_path(_META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("model") != MODEL_NAME or meta.get("version") != _STORE_VERSION:
+        return None
+    return meta
+
+
+def _map_store(meta: dict) -> None:
+    """(Re)map the store files and rebuild the row maps from the id column."""
+    global _embeddings, _rows, _size, _last_note_id, _dead, _mapped_ino
+    vectors = np.load(_store_path(_VECTORS_FILE), mmap_mode="r+")
+    rows = np.load(_store_path(_ROWS_FILE), mmap_mode="r+")
+    _embeddings, _rows = vectors, rows
+    _mapped_ino = os.stat(_store_path(_VECTORS_FILE)).st_ino
+    _size = min(int(meta.get("count", 0)), len(vectors), len(rows))
+    _last_note_id = int(meta.get("last_note_id", 0))
+    _row_of.clear()
+    _dead = 0
+    for row, note_id in enumerate(rows["note_id"][:_size].tolist()):
+        if note_id >= 0:
+            _row_of.setdefault(note_id, []).append(row)
+        else:
+            _dead += 1
+    _backend.reset()
+
+
+def _sync() -> None:
+    """
+    Catch up with other processes, under _lock and _store_lock: remap if
+    the files were replaced (grown or compacted), else take in the rows
+    appended past our count.
+    """
+    global _size, _last_note_id, _dead, _meta_seen
+    if _store_dir is None:
+        return
+    stamp = _meta_stamp()
+    if stamp is None or stamp == _meta_seen:
+        return
+    meta = _read_meta()
+    if meta is None:
+        return
+    _meta_seen = stamp
+
+    count = int(meta.get("count", 0))
+    if (_embeddings is None or count < _size
+            or os.stat(_store_path(_VECTORS_FILE)).st_ino != _mapped_ino):
+        _map_store(meta)
+        return
+    if count > _size:
+        first = _size
+        for row, note_id in enumerate(_rows["note_id"][first:count].tolist(), start=first):
+            if note_id >= 0:
+                _row_of.setdefault(note_id, []).append(row)
+            else:
+                _dead += 1
+        _size = count
+        _backend.add(_embeddings, first, _size)
+    _last_note_id = max(_last_note_id, int(meta.get("last_note_id", 0)))
+
+
+def _sync_if_changed() -> None:
+    """Cheap check for queries: a stat, and a sync only if meta.json moved."""
+    if _store_dir is not None and _meta_stamp() != _meta_seen:
+        with _store_lock(exclusive=False):
+            _sync()
+
+
+def _new_arrays(capacity: int, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Empty matrix + row table; on disk they are built beside the live files."""
+    if _store_dir is None:
+        return np.empty((capacity, dim), dtype=np.float32), np.empty(capacity, dtype=_ROW_DTYPE)
+    vectors = open_memmap(_store_path(_VECTORS_FILE + ".tmp"), mode="w+",
+                          dtype=np.float32, shape=(capacity, dim))
+    rows = open_memmap(_store_path(_ROWS_FILE + ".tmp"), mode="w+",
+                       dtype=_ROW_DTYPE, shape=(capacity,))
+    return vectors, rows
+
+
+def _swap_in(vectors: np.ndarray, rows: np.ndarray) -> None:
+    """Make arrays from _new_arrays the live ones (and the files on disk)."""
+    global _embeddings, _rows, _mapped_ino
+    if _store_dir is not None:
+        vectors.flush()
+        rows.flush()
+        os.replace(_store_path(_VECTORS_FILE + ".tmp"), _store_path(_VECTORS_FILE))
+        os.replace(_store_path(_ROWS_FILE + ".tmp"), _store_path(_ROWS_FILE))
+        _mapped_ino = os.stat(_store_path(_VECTORS_FILE)).st_ino
+    _embeddings, _rows = vectors, rows
+
+
+def _ensure_capacity(dim: int) -> None:
+    """Allocate the matrix on first use and double it when full."""
+    if _embeddings is not None and _size < _embeddings.shape[0]:
+        return
+
+    capacity = _INITIAL_CAPACITY if _embeddings is None else _embeddings.shape[0] * 2
+    vectors, rows = _new_arrays(capacity, dim)
+    if _embeddings is not None:
+        vectors[:_size] = _embeddings[:_size]
+        rows[:_size] = _rows[:_size]
+    _swap_in(vectors, rows)
+
 
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+def _maybe_compact() -> None:
+    """
+    Under _lock and _store_lock: once tombstones reach RAG_COMPACT_FRACTION
+    of the rows, copy the live rows into new files and rebuild the row map
+    and the search backend. Other processes remap on their next sync.
+    """
+    global _size, _dead
+    if _dead < _MIN_COMPACT_ROWS or _dead < RAG_COMPACT_FRACTION * _size:
+        return
+
+    live = np.flatnonzero(_rows["note_id"][:_size] >= 0)
+    capacity = max(_INITIAL_CAPACITY, 2 * len(live))
+    vectors, rows = _new_arrays(capacity, _embeddings.shape[1])
+    vectors[:len(live)] = _embeddings[live]
+    rows[:len(live)] = _rows[live]
+    _swap_in(vectors, rows)
+
+    print(f"[RAG] Compacted store: dropped {_dead} tombstoned rows, {len(live)} left")
+    _size, _dead = len(live), 0
+    _row_of.clear()
+    for row, note_id in enumerate(_rows["note_id"][:_size].tolist()):
+        _row_of.setdefault(note_id, []).append(row)
+    _backend.reset()
+    _persist()
+
+
+def _append_row(note_id: int, start: int, end: int, content_hash: bytes, vec: np.ndarray) -> None:
+    global _size, _last_note_id
+    _ensure_capacity(vec.shape[0])
+    _embeddings[_size] = vec
+    _rows[_size] = (note_id, start, end, content_hash)
+    _row_of.setdefault(note_id, []).append(_size)
+    _last_note_id = max(_last_note_id, note_id)
+    _size += 1
 
-_corpus_texts: List[str] = []
-_corpus_ids: List[str] = []
-_corpus_embeddings: np.ndarray | None = None
-_nn: NearestNeighbors | None = None
 
+def _indexed(note_id: int, content_hash: bytes, before: Optional[int] = None) -> bool:
+    """Whether note_id's live rows (below `before`) hold this text. Under _lock."""
+    rows = _row_of.get(note_id)
+    if not rows or (before is not None and rows[0] >= before):
+        return False
+    row = _rows[rows[0]]
+    return int(row["note_id"]) == note_id and row["hash"].tobytes() == content_hash
 
-def _rebuild_index():
-    global _corpus_embeddings, _nn
-    if not _corpus_texts:
-        _corpus_embeddings = None
-        _nn = None
+
+def _index_notes(notes: List[Tuple[int, str]]) -> None:
+    """Chunk, encode and append a batch of (note_id, text) pairs."""
+    spans = []
+    for note_id, text in notes:
+        content_hash = _content_hash(text)
+        for start, end in _passages(text):
+            spans.append((note_id, start, end, content_hash, text[start:end]))
+    if not spans:
         return
 
-    _corpus_embeddings = _model.encode(_corpus_texts, convert_to_numpy=True)
-    _nn = NearestNeighbors(
-        n_neighbors=min(5, len(_corpus_texts)),
-        metric="cosine"
-    )
-    _nn.fit(_corpus_embeddings)
+    vecs = _encode([span[4] for span in spans])
+    with _lock, _store_lock():
+        _sync()
+        first = _size
+        for (note_id, start, end, content_hash, _), vec in zip(spans, vecs):
+            # Another process (or thread) may have indexed this text meanwhile
+            if _indexed(note_id, content_hash, before=first):
+                continue
+            _append_row(note_id, start, end, content_hash, vec)
+        if _size > first:
+            _backend.add(_embeddings, first, _size)
+            _persist()
 
 
-def init_vector_store():
+def _persist() -> None:
+    """
+    Record the row count, under _store_lock. Rows are written through the
+    shared mapping, so they are already in the page cache; meta.json is
+    written last, so a crash mid-add leaves the store at the previous count.
     """
-    Kept for API compatibility with chromadb version.
-    Nothing external to init; model loads at import time.
+    global _meta_seen
+    if _store_dir is None or _embeddings is None:
+        return
+
+    tmp = _store_path(_META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": _STORE_VERSION,
+            "model": MODEL_NAME,
+            "dim": int(_embeddings.shape[1]),
+            "count": _size,
+            "last_note_id": _last_note_id,
+        }, f)
+    os.replace(tmp, _store_path(_META_FILE))
+    _meta_seen = _meta_stamp()
+
+
+def _load_store() -> None:
     """
+    Map an existing store into memory. Nothing is re-encoded; only the id
+    column is read to rebuild the note_id -> row map.
+    """
+    global _meta_seen
+    if _meta_stamp() is None:
+        return
+    try:
+        meta = _read_meta()
+        if meta is None:
+            print("[RAG] Store is from another model or layout, re-encoding notes")
+            return
+        _map_store(meta)
+        _meta_seen = _meta_stamp()
+    except Exception as e:
+        print("[RAG] Could not load embedding store, re-encoding notes:", e)
+
+
+@atexit.register
+def _flush_store() -> None:
+    """Push the mapped pages to disk on a clean shutdown."""
+    with _lock:
+        if _store_dir is not None and _embeddings is not None:
+            _embeddings.flush()
+            _rows.flush()
+
+
+def _rehydrate_from_notes() -> None:
+    """Encode notes saved to SQLite after the store was last written."""
+    with _lock:
+        last_id = _last_note_id
+
+    pending = get_notes_after(last_id)
+    if not pending:
+        return
+
+    print(f"[RAG] Encoding {len(pending)} notes missing from the store")
+    for start in range(0, len(pending), _REHYDRATE_BATCH):
+        batch = pending[start:start + _REHYDRATE_BATCH]
+        _index_notes([(note_id, text or "") for note_id, text in batch])
+
+
+# ---------- public API ----------
+
+def init_vector_store(store_dir: str | None = RAG_STORE_DIR, rehydrate: bool = True):
+    """
+    Open (or create) the on-disk embedding store and catch it up with the
+    notes table. Pass store_dir=None to keep the index in memory only.
+
+    Returns (None, None) for API compatibility with the chromadb version.
+    """
+    global _embeddings, _rows, _size, _last_note_id, _dead, _store_dir, _mapped_ino, _meta_seen
+    _flush_store()
+    with _lock:
+        _embeddings, _rows, _size, _last_note_id, _dead = None, None, 0, 0, 0
+        _mapped_ino = _meta_seen = None
+        _row_of.clear()
+        _backend.reset()
+        _store_dir = store_dir
+        if _store_dir is not None:
+            os.makedirs(_store_dir, exist_ok=True)
+            _load_store()
+
+    if rehydrate:
+        _rehydrate_from_notes()
     return None, None
 
 
-def add_note_to_rag(note_id: str, text: str) -> None:
-    global _corpus_texts, _corpus_ids
-    _corpus_ids.append(note_id)
-    _corpus_texts.append(text)
-    _rebuild_index()
+def _retire(rows: List[int]) -> None:
+    """Tombstone rows under _lock and _store_lock (skipping any another process retired)."""
+    global _dead
+    rows = [row for row in rows if _rows["note_id"][row] >= 0]
+    _rows["note_id"][rows] = -1
+    _embeddings[rows] = 0.0
+    _dead += len(rows)
+    _maybe_compact()
+
+
+def add_note_to_rag(note_id: int, text: str) -> None:
+    content_hash = _content_hash(text)
+    with _lock, _store_lock():
+        _sync()
+        if _indexed(note_id, content_hash):
+            return
+        rows = _row_of.pop(note_id, None)
+        if rows:
+            # Content changed: retire the old passages and index the new text.
+            _retire(rows)
+
+    _index_notes([(note_id, text)])
+
+
+def remove_note_from_rag(note_id: int) -> None:
+    with _lock, _store_lock():
+        _sync()
+        rows = _row_of.pop(note_id, None)
+        if rows:
+            _retire(rows)
+
+
+def _train_backend() -> None:
+    """Train the search backend if it asks to be, without holding _lock."""
+    if not _train_lock.acquire(blocking=False):
+        return  # another thread is training; search what is there meanwhile
+    try:
+        with _lock:
+            if not _backend.needs_training(_size):
+                return
+            matrix, n = _embeddings, _size
+        trained = _backend.train(matrix, n)
+        with _lock:
+            _backend.install(trained, _embeddings, _size)
+    finally:
+        _train_lock.release()
+
 
+def query_passages(query: str, k: int = 4, max_tokens: int = RAG_CONTEXT_TOKENS,
+                   stats: Optional[dict] = None) -> List[dict]:
+    """
+    Returns up to k passages most similar to the query, best first, whose
+    combined estimated size stays within max_tokens. Each passage is a dict
+    with note_id, start, end, score and text.
+
+    A long query is chunked like a note and each of its passages searched
+    (the embedding cache then serves them when the note itself is indexed);
+    a stored passage scores its best match against any of them.
+
+    Passages from notes whose text is identical to the query are skipped,
+    so re-processing a saved note gets the same context as the first time.
+    If given, `stats` gets embed_ms and search_ms (search + passage fetch).
+    """
+    if _size == 0:
+        with _lock:
+            _sync_if_changed()
+        if _size == 0:
+            return []
+
+    t0 = time.perf_counter()
+    pieces = [query[start:end] for start, end in _passages(query)] or [query]
+    query_embs = _encode(pieces)
+    query_hash = _content_hash(query)
+    t1 = time.perf_counter()
+
+    _train_backend()
+    with _lock:
+        _sync_if_changed()
+        n = _size
+        # Over-fetch so tombstoned rows and passages skipped for size
+        # can be replaced.
+        fetch = min(2 * k + _dead, n)
+        best: Dict[int, float] = {}
+        for query_emb in query_embs:
+            top, scores = _backend.search(_embeddings, n, query_emb, fetch)
+            for row, score in zip(top.tolist(), scores.tolist()):
+                if score > best.get(row, -np.inf):
+                    best[row] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        rows = _rows[[row for row, _ in ranked]]
+        candidates = [
+            (int(row["note_id"]), int(row["start"]), int(row["end"]), float(score))
+            for row, (_, score) in zip(rows, ranked)
+            if row["note_id"] >= 0 and row["hash"].tobytes() != query_hash
+        ]
 
-def query_context(query: str, k: int = 4) -> List[str]:
+    texts = get_note_texts(list({c[0] for c in candidates}))
+
+    passages = []
+    used = 0
+    for note_id, start, end, score in candidates:
+        if note_id not in texts:
+            continue
+        text = texts[note_id][start:end].strip()
+        cost = estimate_tokens(text)
+        if used + cost > max_tokens:
+            continue
+        passages.append({"note_id": note_id, "start": start, "end": end, "score": score, "text": text})
+        used += cost
+        if len(passages) == k:
+            break
+
+    if stats is not None:
+        stats["embed_ms"] = (t1 - t0) * 1000
+        stats["search_ms"] = (time.perf_counter() - t1) * 1000
+    return passages
+
+
+def query_context(query: str, k: int = 4, max_tokens: int = RAG_CONTEXT_TOKENS,
+                  stats: Optional[dict] = None) -> List[str]:
     """
-    Returns up to k most similar note texts.
+    Returns the text of up to k relevant passages within max_tokens.
     If corpus is empty, returns [].
     """
-    if _nn is None or _corpus_embeddings is None or not _corpus_texts:
-        return []
-
-    query_emb = _model.encode([query], convert_to_numpy=True)
-    n_neighbors = min(k, len(_corpus_texts))
-    distances, indices = _nn.kneighbors(query_emb, n_neighbors=n_neighbors)
-    idxs = indices[0]
-    return [_corpus_texts[i] for i in idxs]
+    return [p["text"] for p in query_passages(query, k=k, max_tokens=max_tokens, stats=stats)]
+
+
+def rag_stats() -> dict:
+    with _lock:
+        live = len(_row_of)
+        rows = _size
+    return {
+        "notes": live,
+        "rows": rows,
+        "persistent": _store_dir is not None,
+        "search_backend": _backend.name,
+        "embedding_cache": cache_stats(),
+    }
@@ -0,0 +1,133 @@
+# sqlite_lru.py
+"""
+Size-bounded key/value cache in a SQLite file, shared by llm_cache.py
+and ocr_cache.py.
+
+- One table per cache: key, the cache's value columns, size, created
+  and last_used (indexed for eviction)
+- Entries optionally expire after ttl_s seconds
+- Every EVICT_EVERY puts, expired entries are dropped and then the least
+  recently used ones until the stored values fit in max_mb
+- An empty path disables the cache: get() misses, put() does nothing
+- Errors are logged and treated as misses; a cache never fails a request
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+EVICT_EVERY = 50  # puts between size checks
+
+
+class SQLiteLRU:
+    def __init__(self, path: str, table: str, columns: Sequence[str], max_mb: float,
+                 ttl_s: Optional[float] = None, label: str = "Cache"):
+        self.path = path
+        self.table = table
+        self.columns = tuple(columns)
+        self.max_mb = max_mb
+        self.ttl_s = ttl_s
+        self.label = label
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+        self._initialized = False
+
+    def _conn(self):
+        if self._initialized:
+            return sqlite3.connect(self.path, timeout=10)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        with self._lock:
+            if not self._initialized:
+                value_columns = "".join(f"{c} TEXT, " for c in self.columns)
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, "
+                    f"{value_columns}size INTEGER, created REAL, last_used REAL)"
+                )
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table} (last_used)"
+                )
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple]:
+        """The stored value columns for `key`, or None."""
+        if not self.path:
+            return None
+        now = time.time()
+        oldest = now - self.ttl_s if self.ttl_s else 0
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE key = ? AND created > ?",
+                (key, oldest),
+            ).fetchone()
+            if row:
+                conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+                conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"{self.label} read failed:", e)
+            return None
+
+        with self._lock:
+            self._stats["hits" if row else "misses"] += 1
+        return row
+
+    def put(self, key: str, *values: str) -> None:
+        if not self.path:
+            return
+        size = sum(len(v.encode("utf-8")) for v in values if v)
+        now = time.time()
+        with self._lock:
+            self._stats["puts"] += 1
+            evict = self._stats["puts"] % EVICT_EVERY == 0
+        try:
+            conn = self._conn()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, {', '.join(self.columns)}, size, created, last_used) "
+                f"VALUES (?, {', '.join('?' for _ in self.columns)}, ?, ?, ?)",
+                (key, *values, size, now, now),
+            )
+            conn.commit()
+            if evict:
+                self._evict(conn, now)
+            conn.close()
+        except Exception as e:
+            print(f"{self.label} write failed:", e)
+
+    def _evict(self, conn, now: float) -> None:
+        """Drop expired entries, then least recently used ones until under budget."""
+        removed = 0
+        if self.ttl_s:
+            removed = conn.execute(
+                f"DELETE FROM {self.table} WHERE created <= ?", (now - self.ttl_s,)
+            ).rowcount
+
+        budget = self.max_mb * 1024 * 1024
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total > budget:
+            excess = total - budget
+            victims = []
+            for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_used"):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+            removed += len(victims)
+        conn.commit()
+
+        with self._lock:
+            self._stats["evictions"] += removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["enabled"] = bool(self.path)
+        return stats
@@ -1,10 +1,40 @@
 # telemetry.py
+"""
+Per-request telemetry rows in telemetry.csv.
 
+- log_telemetry() only puts the row on a bounded queue; a background
+  thread appends queued rows in batches (every TELEMETRY_FLUSH_S or
+  TELEMETRY_BATCH rows), so requests never wait on the disk. When the
+  queue is full the row is dropped and counted.
+- Trace collects per-stage spans (upload read, OCR per page, embed,
+  retrieve, each LLM call, DB write) for a request; they are stored in
+  the `details` JSON column under "spans".
+- Appends and rotation (past TELEMETRY_MAX_MB, keeping TELEMETRY_BACKUPS
+  files as telemetry.csv.1, .2, ...) happen under an exclusive lock on
+  telemetry.csv.lock, so several app processes can share one file.
+"""
+
+import atexit
 import csv
+import json
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
-TELEMETRY_FILE = "telemetry.csv"
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single process assumed
+    fcntl = None
+
+from app import metrics
+from app.config import (
+    TELEMETRY_BACKUPS, TELEMETRY_BATCH, TELEMETRY_FILE, TELEMETRY_FLUSH_S,
+    TELEMETRY_MAX_MB, TELEMETRY_QUEUE_SIZE,
+)
+
 FIELDNAMES = [
     "timestamp",
     "pathway",
@@ -13,8 +43,186 @@ FIELDNAMES = [
     "tokens_out",
     "cost_usd",
     "error",
+    "details",
 ]
 
+_queue = queue.Queue(maxsize=TELEMETRY_QUEUE_SIZE)
+_lock = threading.Lock()
+_writer = None
+_header_checked = False
+_stats = {"queued": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+
+
+# ---------- spans ----------
+
+class Trace:
+    """
+    Spans for one request: {"name", "ms", "start_ms"?, **attrs}, where
+    start_ms is the offset from the start of the trace. Safe to add to
+    from several threads.
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float, start_ms: float | None = None, **attrs) -> None:
+        span = {"name": name, "ms": round(ms, 1)}
+        if start_ms is not None:
+            span["start_ms"] = round(start_ms, 1)
+        span.update(attrs)
+        with self._lock:
+            self._spans.append(span)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the block; attributes set on the yielded dict are kept."""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            end = time.perf_counter()
+            self.add(name, (end - start) * 1000, (start - self._t0) * 1000, **attrs)
+
+    @property
+    def spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+
+# ---------- file handling ----------
+
+@contextmanager
+def _file_lock():
+    """
+    Exclusive across processes (flock on a side file). Within a process
+    only the writer thread touches the file.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(TELEMETRY_FILE + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _upgrade_header() -> None:
+    """
+    Rewrite a file created with an older column list so new rows line up.
+    Old rows keep their values; columns they never had stay empty.
+    """
+    with open(TELEMETRY_FILE, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    if not rows or rows[0] == FIELDNAMES:
+        return
+
+    old_header = rows[0]
+    tmp = TELEMETRY_FILE + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in rows[1:]:
+            writer.writerow({k: v for k, v in zip(old_header, row) if k in FIELDNAMES})
+    os.replace(tmp, TELEMETRY_FILE)
+
+
+def _rotate() -> None:
+    """telemetry.csv -> .1 -> .2 ...; the oldest past TELEMETRY_BACKUPS goes."""
+    if TELEMETRY_BACKUPS <= 0:
+        os.remove(TELEMETRY_FILE)
+        return
+    for n in range(TELEMETRY_BACKUPS - 1, 0, -1):
+        older = f"{TELEMETRY_FILE}.{n}"
+        if os.path.exists(older):
+            os.replace(older, f"{TELEMETRY_FILE}.{n + 1}")
+    os.replace(TELEMETRY_FILE, TELEMETRY_FILE + ".1")
+
+
+def _write_batch(rows: list) -> None:
+    global _header_checked
+
+    with _file_lock():
+        # Checked under the lock: another process may have rotated already
+        size = os.path.getsize(TELEMETRY_FILE) if os.path.exists(TELEMETRY_FILE) else 0
+        if size and size >= TELEMETRY_MAX_MB * 1024 * 1024:
+            _rotate()
+            with _lock:
+                _stats["rotations"] += 1
+            size = 0
+        elif size and not _header_checked:
+            _upgrade_header()
+        _header_checked = True
+
+        with open(TELEMETRY_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            if not size:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+# ---------- background writer ----------
+
+def _drain(first) -> list:
+    """`first` plus whatever else arrives within the flush interval."""
+    batch = [first]
+    deadline = time.monotonic() + TELEMETRY_FLUSH_S
+    while len(batch) < TELEMETRY_BATCH:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run_writer() -> None:
+    while True:
+        batch = _drain(_queue.get())
+        try:
+            _write_batch(batch)
+            with _lock:
+                _stats["written"] += len(batch)
+                _stats["batches"] += 1
+        except Exception as e:
+            print("Telemetry write failed:", e)
+            with _lock:
+                _stats["errors"] += 1
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run_writer, name="telemetry-writer", daemon=True)
+            _writer.start()
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Wait until every queued row is on disk. False on timeout."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+atexit.register(flush)
+
 
 def log_telemetry(
     pathway: str,
@@ -23,21 +231,37 @@ def log_telemetry(
     tokens_out: int | None,
     cost: float | None,
     error: str | None,
+    details: dict | None = None,
 ) -> None:
-    exists = os.path.exists(TELEMETRY_FILE)
+    """
+    Queue one row per request (and count it in the rolling metrics).
+    `details` holds per-stage timings and spans and is stored as a JSON
+    string. Never blocks: a full queue drops the row.
+    """
+    metrics.observe(pathway, latency_ms, tokens_in, tokens_out, cost, error)
+    row = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "pathway": pathway,
+        "latency_ms": latency_ms,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "cost_usd": cost,
+        "error": error,
+        "details": json.dumps(details) if details else None,
+    }
+    _ensure_writer()
+    try:
+        _queue.put_nowait(row)
+    except queue.Full:
+        with _lock:
+            _stats["dropped"] += 1
+        return
+    with _lock:
+        _stats["queued"] += 1
 
-    with open(TELEMETRY_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
 
-        if not exists:
-            writer.writeheader()
-
-        writer.writerow({
-            "timestamp": datetime.now().isoformat(timespec="seconds"),
-            "pathway": pathway,
-            "latency_ms": latency_ms,
-            "tokens_in": tokens_in,
-            "tokens_out": tokens_out,
-            "cost_usd": cost,
-            "error": error,
-        })
+def telemetry_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["pending"] = _queue.unfinished_tasks
+    return stats
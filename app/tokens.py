@@ -0,0 +1,149 @@
+# tokens.py
+"""
+Token counting, prompt budgeting and cost for LLM calls.
+
+- count_tokens() uses tiktoken when it is installed (optional dependency)
+  and falls back, with a one-time warning, to the ~4 characters per token
+  estimate from chunking.py
+- fit_context() keeps retrieved passages, best first, until the prompt
+  budget (LLM_PROMPT_TOKENS) is spent; the first passage that does not fit
+  is cut at a word boundary, the rest are dropped
+- cost_usd() prices a call from the PRICES table (USD per 1M tokens),
+  extended / overridden by LLM_PRICES (ignored with a warning if it is
+  not valid JSON of {model: [input, output]}); ":free" models cost nothing
+"""
+
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.chunking import estimate_tokens
+from app.config import LLM_PRICES, LLM_PROMPT_TOKENS
+
+# (input, output) USD per 1M tokens, keyed by model name without the
+# provider prefix ("openai/gpt-4o-mini" -> "gpt-4o-mini")
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "nova-micro-v1": (0.035, 0.14),
+    "nova-lite-v1": (0.06, 0.24),
+    "nova-pro-v1": (0.80, 3.20),
+}
+if LLM_PRICES:
+    try:
+        PRICES.update({name: (float(p[0]), float(p[1])) for name, p in json.loads(LLM_PRICES).items()})
+    except (ValueError, TypeError, AttributeError, IndexError) as e:
+        print("Ignoring malformed LLM_PRICES (expected {model: [input, output]}):", e)
+
+_FALLBACK_ENCODING = "cl100k_base"
+# Passages cut to fewer tokens than this are dropped instead
+_MIN_PASSAGE_TOKENS = 32
+
+_encodings = {}
+_encoding_lock = threading.Lock()
+_unpriced = set()
+_warned_estimate = False
+
+
+def _encoding(model: str):
+    """tiktoken encoding for `model`, or None without tiktoken."""
+    global _warned_estimate
+    if model in _encodings:
+        return _encodings[model]
+    with _encoding_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    enc = tiktoken.encoding_for_model(model.split("/")[-1])
+                except KeyError:  # not an OpenAI model: closest general-purpose BPE
+                    enc = tiktoken.get_encoding(_FALLBACK_ENCODING)
+            except Exception as e:  # not installed, or its BPE file can't be fetched
+                if not _warned_estimate:
+                    _warned_estimate = True
+                    print("tiktoken unavailable, estimating tokens (~4 chars each):", e)
+                enc = None
+            _encodings[model] = enc
+    return _encodings[model]
+
+
+def tokenizer_name(model: str) -> str:
+    enc = _encoding(model)
+    return enc.name if enc is not None else "estimate"
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return estimate_tokens(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_messages(messages: List[dict], model: str) -> int:
+    """Prompt tokens for a chat request (content plus ~4 per message of framing)."""
+    return sum(count_tokens(m["content"], model) + 4 for m in messages) + 2
+
+
+def _truncate(text: str, max_tokens: int, model: str) -> str:
+    """Head of `text` within max_tokens, cut back to the last whitespace."""
+    enc = _encoding(model)
+    if enc is None:
+        head = text[:max_tokens * 4]
+    else:
+        head = enc.decode(enc.encode(text, disallowed_special=())[:max_tokens])
+    cut = head.rfind(" ")
+    return (head[:cut] if cut > 0 else head).rstrip()
+
+
+def fit_context(context_chunks: List[str], fixed_tokens: int, model: str,
+                budget: int = LLM_PROMPT_TOKENS) -> Tuple[List[str], dict]:
+    """
+    Passages (already ranked best first) that fit in what the budget
+    leaves after `fixed_tokens` (system prompt, instructions, note).
+    Returns (chunks, stats) with stats = {"context_tokens", "passages",
+    "dropped", "truncated"}.
+    """
+    remaining = budget - fixed_tokens
+    kept, used, truncated = [], 0, False
+    separator = count_tokens("\n\n", model)
+    for chunk in context_chunks:
+        room = remaining - used - (separator if kept else 0)
+        if room < _MIN_PASSAGE_TOKENS:
+            break
+        tokens = count_tokens(chunk, model)
+        if tokens > room:
+            chunk = _truncate(chunk, room, model)
+            tokens = count_tokens(chunk, model)
+            truncated = True
+        kept.append(chunk)
+        used += tokens + (separator if len(kept) > 1 else 0)
+        if truncated:
+            break
+    return kept, {
+        "context_tokens": used,
+        "passages": len(kept),
+        "dropped": len(context_chunks) - len(kept),
+        "truncated": truncated,
+    }
+
+
+def price(model: str) -> Optional[Tuple[float, float]]:
+    """(input, output) USD per 1M tokens, or None if the model isn't listed."""
+    if model.endswith(":free"):
+        return 0.0, 0.0
+    for name in (model, model.split("/")[-1]):
+        if name in PRICES:
+            return PRICES[name]
+    return None
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prices = price(model)
+    if prices is None:
+        if model not in _unpriced:
+            _unpriced.add(model)
+            print(f"No price for model {model!r}; add it to LLM_PRICES. Cost logged as 0.")
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
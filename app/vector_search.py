@@ -0,0 +1,213 @@
+# vector_search.py
+"""
+Search backends for the RAG passage matrix.
+
+Vectors are unit-length float32, so inner product == cosine similarity.
+rag.py owns the matrix; a backend is told about new rows through add()
+and asked for the best m rows of matrix[:n] through search(). Callers hold
+rag's lock around both, so backends need no locking of their own.
+Backends that need training say so through needs_training(); the caller
+then runs train() without the lock (it only reads the matrix) and hands
+the result to install() under the lock again.
+
+- exact: one matrix-vector product + argpartition (default)
+- ivf:   spherical k-means coarse quantizer in NumPy; only the nprobe
+         closest lists are scanned
+- hnsw:  hnswlib graph index (optional dependency)
+
+ANN structures live in memory and are rebuilt lazily on the first search
+after a restart.
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def top_m(scores: np.ndarray, m: int) -> np.ndarray:
+    """Indices of the m largest scores, best first."""
+    m = min(m, len(scores))
+    if m <= 0:
+        return np.empty(0, dtype=np.int64)
+    if m < len(scores):
+        idx = np.argpartition(-scores, m - 1)[:m]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx])]
+
+
+class ExactSearch:
+    name = "exact"
+
+    def reset(self) -> None:
+        pass
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        pass
+
+    def needs_training(self, n: int) -> bool:
+        return False
+
+    def search(self, matrix: np.ndarray, n: int, query: np.ndarray, m: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = matrix[:n] @ query
+        idx = top_m(scores, m)
+        return idx, scores[idx]
+
+
+class IVFSearch:
+    """
+    Inverted-file index. Scans exactly until min_train rows exist and it
+    has been trained on ~sqrt(n) centroids, every row assigned to its
+    nearest one. Asks to be retrained once the corpus has grown 4x since.
+    """
+    name = "ivf"
+
+    def __init__(self, nprobe: int = 8, min_train: int = 4096, iters: int = 10, seed: int = 0):
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.iters = iters
+        self.seed = seed
+        self._exact = ExactSearch()
+        self._generation = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self._generation += 1  # a train() started before this is stale
+        self._centroids: np.ndarray | None = None
+        self._lists: List[List[int]] = []
+        self._arrays: Dict[int, np.ndarray] = {}  # cached np views of _lists
+        self._trained_at = 0
+
+    @staticmethod
+    def _assign_to(lists: List[List[int]], centroids: np.ndarray, matrix: np.ndarray,
+                   start: int, end: int, block: int = 8192) -> None:
+        for lo in range(start, end, block):
+            hi = min(lo + block, end)
+            labels = np.argmax(matrix[lo:hi] @ centroids.T, axis=1)
+            for row, c in zip(range(lo, hi), labels.tolist()):
+                lists[c].append(row)
+
+    def _assign(self, matrix: np.ndarray, start: int, end: int) -> None:
+        self._assign_to(self._lists, self._centroids, matrix, start, end)
+        self._arrays.clear()
+
+    def needs_training(self, n: int) -> bool:
+        return n >= self.min_train and (self._centroids is None or n >= 4 * self._trained_at)
+
+    def train(self, matrix: np.ndarray, n: int):
+        """
+        k-means on a sample of matrix[:n], then every row assigned to its
+        list. Only reads the matrix and touches no index state.
+        """
+        print(f"[RAG] Training IVF index on {n} rows")
+        rng = np.random.default_rng(self.seed)
+        nlist = max(1, int(math.sqrt(n)))
+        sample_size = min(n, 64 * nlist)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))])
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty lists from random sample points.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        lists = [[] for _ in range(nlist)]
+        self._assign_to(lists, centroids, matrix, 0, n)
+        return self._generation, n, centroids, lists
+
+    def install(self, trained, matrix: np.ndarray, n: int) -> None:
+        """Swap in the result of train() and assign rows added since."""
+        generation, trained_at, centroids, lists = trained
+        if generation != self._generation:
+            return  # reset() since: trained on rows that are gone
+        self._centroids = centroids
+        self._lists = lists
+        self._arrays = {}
+        self._assign(matrix, trained_at, n)
+        self._trained_at = trained_at
+
+    def _list_rows(self, c: int) -> np.ndarray:
+        arr = self._arrays.get(c)
+        if arr is None:
+            arr = np.asarray(self._lists[c], dtype=np.int64)
+            self._arrays[c] = arr
+        return arr
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        if self._centroids is not None:
+            self._assign(matrix, start, end)
+
+    def search(self, matrix: np.ndarray, n: int, query: np.ndarray, m: int) -> Tuple[np.ndarray, np.ndarray]:
+        if n < self.min_train or self._centroids is None:
+            return self._exact.search(matrix, n, query, m)
+
+        probe = top_m(self._centroids @ query, self.nprobe)
+        cand = np.concatenate([self._list_rows(int(c)) for c in probe])
+        scores = matrix[cand] @ query
+        order = top_m(scores, m)
+        return cand[order], scores[order]
+
+
+class HNSWSearch:
+    """hnswlib graph index; rows are inserted lazily before each search."""
+    name = "hnsw"
+
+    def __init__(self, ef: int = 64, M: int = 16, ef_construction: int = 200):
+        import hnswlib  # noqa: F401  (fail early so make_backend can fall back)
+        self.ef = ef
+        self.M = M
+        self.ef_construction = ef_construction
+        self.reset()
+
+    def reset(self) -> None:
+        self._index = None
+        self._count = 0
+
+    def _sync(self, matrix: np.ndarray, n: int) -> None:
+        import hnswlib
+        if self._index is None:
+            self._index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            self._index.init_index(max_elements=max(1024, 2 * n), M=self.M,
+                                   ef_construction=self.ef_construction)
+        if n > self._index.get_max_elements():
+            self._index.resize_index(max(n, 2 * self._index.get_max_elements()))
+        if self._count < n:
+            self._index.add_items(np.asarray(matrix[self._count:n]), np.arange(self._count, n))
+            self._count = n
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        pass  # picked up by _sync on the next search
+
+    def needs_training(self, n: int) -> bool:
+        return False
+
+    def search(self, matrix: np.ndarray, n: int, query: np.ndarray, m: int) -> Tuple[np.ndarray, np.ndarray]:
+        self._sync(matrix, n)
+        m = min(m, n)
+        self._index.set_ef(max(self.ef, m))
+        labels, distances = self._index.knn_query(query, k=m)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+
+def make_backend(name: str, nprobe: int = 8, ef: int = 64):
+    """Build a backend by config name, falling back to exact search."""
+    name = (name or "exact").lower()
+    try:
+        if name == "ivf":
+            return IVFSearch(nprobe=nprobe)
+        if name == "hnsw":
+            return HNSWSearch(ef=ef)
+    except ImportError as e:
+        print(f"[RAG] {name} backend unavailable ({e}), using exact search")
+        return ExactSearch()
+
+    if name != "exact":
+        print(f"[RAG] Unknown search backend {name!r}, using exact search")
+    return ExactSearch()
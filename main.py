@@ -1,6 +1,12 @@
-from app.app import app
 import os
 
 if __name__ == "__main__":
+    # Imported here so OCR pool workers (spawned, which re-import this
+    # module) don't start a second copy of the app.
+    from app.app import app
+    from app.jobs import start_workers
+
+    start_workers()
+
     port = int(os.environ.get("PORT", 5000))
     app.run(host="127.0.0.1", port=port, debug=False)
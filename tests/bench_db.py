@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from app import database
+
+NOTE_TEXT = "Photosynthesis converts light energy into chemical energy. " * 40  # ~2.4 KB
+
+
+class LegacyDB:
+    """The old access pattern: a fresh connection per call, default journal."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "timestamp TEXT, raw_text TEXT, summary TEXT, flashcards_json TEXT)"
+        )
+        conn.commit()
+        conn.close()
+
+    def save_note(self, raw_text, summary, flashcards_json, timestamp):
+        conn = sqlite3.connect(self.path)
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO notes (timestamp, raw_text, summary, flashcards_json) VALUES (?, ?, ?, ?)",
+            (timestamp, raw_text, summary, flashcards_json),
+        )
+        conn.commit()
+        note_id = cur.lastrowid
+        conn.close()
+        return note_id
+
+    def get_note_by_id(self, note_id):
+        conn = sqlite3.connect(self.path)
+        row = conn.execute(
+            "SELECT id, timestamp, raw_text, summary, flashcards_json FROM notes WHERE id = ?",
+            (note_id,),
+        ).fetchone()
+        conn.close()
+        return row
+
+
+def run_load(db, seed_notes, readers, writers, seconds):
+    """Readers fetch random notes while writers insert; returns per-kind latencies."""
+    for _ in range(seed_notes):
+        db.save_note(NOTE_TEXT, "summary", "[]", "2025-01-01T00:00:00")
+
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(kind):
+        rng = random.Random()
+        local, failed = [], 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                if kind == "write":
+                    db.save_note(NOTE_TEXT, "summary", "[]", "2025-01-01T00:00:00")
+                else:
+                    db.get_note_by_id(rng.randint(1, seed_notes))
+                local.append(time.perf_counter() - t0)
+            except sqlite3.OperationalError:
+                failed += 1  # "database is locked"
+        with lock:
+            latencies[kind].extend(local)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=("read",)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write",)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def report(label, latencies, errors, seconds):
+    for kind in ("read", "write"):
+        lat = np.array(latencies[kind]) * 1000
+        if len(lat) == 0:
+            print(f"{label:<8} {kind:<6} {'-':>9} {'-':>8} {'-':>8} {errors[kind]:>7}")
+            continue
+        print(f"{label:<8} {kind:<6} {len(lat) / seconds:>9.0f} {np.percentile(lat, 50):>8.3f} "
+              f"{np.percentile(lat, 99):>8.3f} {errors[kind]:>7}")
+
+
+def bench_db(seed_notes, readers, writers, seconds):
+    print(f"\n=== SQLITE LOAD: {readers} readers + {writers} writers, {seconds}s, "
+          f"{seed_notes} seeded notes ===\n")
+    print(f"{'layer':<8} {'op':<6} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyDB(os.path.join(tmp, "legacy.db"))
+        latencies, errors = run_load(legacy, seed_notes, readers, writers, seconds)
+        report("legacy", latencies, errors, seconds)
+
+        database.DB_PATH = os.path.join(tmp, "pooled.db")
+        database.init_db()
+        latencies, errors = run_load(database, seed_notes, readers, writers, seconds)
+        report("pooled", latencies, errors, seconds)
+        database.close_pool()
+
+
+def bench_history(notes, pages):
+    """Keyset page fetches at different depths vs the old load-everything query."""
+    print(f"\n=== HISTORY: {notes} notes, {pages} fetches per depth ===\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "history.db")
+        database.init_db()
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notes (timestamp, raw_text, summary, flashcards_json, preview) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((f"2025-01-01T00:00:{i % 60:02d}", NOTE_TEXT, "summary", "[]",
+                  NOTE_TEXT[:database.PREVIEW_CHARS]) for i in range(notes)),
+            )
+
+        print(f"{'query':<28} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, before in [("page 1", None), ("middle", notes // 2), ("last page", 60)]:
+            lat = []
+            for _ in range(pages):
+                t0 = time.perf_counter()
+                database.get_notes_page(before_id=before, limit=50)
+                lat.append((time.perf_counter() - t0) * 1000)
+            print(f"{'keyset ' + label:<28} {np.percentile(lat, 50):>8.3f} {np.percentile(lat, 99):>8.3f}")
+
+        lat = []
+        for _ in range(3):
+            t0 = time.perf_counter()
+            with database.connection() as conn:
+                conn.execute(
+                    "SELECT id, timestamp, substr(raw_text,1,120) FROM notes ORDER BY id DESC"
+                ).fetchall()
+            lat.append((time.perf_counter() - t0) * 1000)
+        print(f"{'old: all notes':<28} {np.percentile(lat, 50):>8.3f} {max(lat):>8.3f}")
+        database.close_pool()
+
+
+def synthetic_corpus(notes, seed=0):
+    """Notes drawn from a Zipf-distributed vocabulary, ~330 words each.
+
+    Words are "w<rank>x" so that no word is a prefix of another and
+    search-as-you-type prefixes don't skew the numbers.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}x" for i in range(20_000)])
+    ranks = np.minimum(rng.zipf(1.2, size=(notes, 330)), len(vocab)) - 1
+    for i, row in enumerate(ranks):
+        words = vocab[row]
+        yield (f"2025-01-01T00:00:{i % 60:02d}", " ".join(words[:300]), " ".join(words[300:320]),
+               json.dumps([{"question": " ".join(words[320:325]), "answer": " ".join(words[325:])}]),
+               " ".join(words[:20])[:database.PREVIEW_CHARS])
+
+
+def bench_search(notes, repeats):
+    """FTS5 (bm25, snippets) vs a LIKE scan over the same three columns."""
+    print(f"\n=== SEARCH: {notes} notes, {repeats} runs per query ===\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "search.db")
+        database.init_db()
+        t0 = time.perf_counter()
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notes (timestamp, raw_text, summary, flashcards_json, preview) "
+                "VALUES (?, ?, ?, ?, ?)",
+                synthetic_corpus(notes),
+            )
+        print(f"Inserted (with FTS triggers) in {time.perf_counter() - t0:.1f} s\n")
+
+        def like(term):
+            with database.connection() as conn:
+                pattern = f"%{term}%"
+                return conn.execute(
+                    "SELECT id, timestamp, preview FROM notes "
+                    "WHERE raw_text LIKE ? OR summary LIKE ? OR flashcards_json LIKE ? "
+                    "ORDER BY id DESC LIMIT 20",
+                    (pattern, pattern, pattern),
+                ).fetchall()
+
+        print(f"{'query':<22} {'fts hits':>8} {'fts ms':>8} {'like ms':>8}")
+        # common (w0x in ~every note) -> medium -> rare; two-word queries need both
+        for query in ["w0x", "w40x", "w900x", "w9000x", "w5x w40x", "w123x w77x"]:
+            fts, slow = [], []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                hits = database.search_notes(query, limit=20)
+                fts.append((time.perf_counter() - t0) * 1000)
+            for _ in range(max(1, repeats // 10)):
+                t0 = time.perf_counter()
+                like(query.split()[0] + " ")
+                slow.append((time.perf_counter() - t0) * 1000)
+            print(f"{query:<22} {len(hits):>8} {np.median(fts):>8.2f} {np.median(slow):>8.2f}")
+        database.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the notes DB.")
+    parser.add_argument("mode", nargs="?", choices=["load", "history", "search"], default="load",
+                        help="load: concurrent reads/writes; history: paginated history; "
+                             "search: FTS5 vs LIKE")
+    parser.add_argument("--notes", type=int, default=None,
+                        help="history / search: corpus size (default 100k / 20k)")
+    parser.add_argument("--seed", type=int, default=2000, help="notes inserted before the run")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.mode == "history":
+        bench_history(args.notes or 100_000, pages=200)
+    elif args.mode == "search":
+        bench_search(args.notes or 20_000, repeats=20)
+    else:
+        bench_db(args.seed, args.readers, args.writers, args.seconds)
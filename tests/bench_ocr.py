@@ -0,0 +1,506 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+import numpy as np
+from pdf2image import convert_from_bytes
+from PIL import Image, ImageDraw
+
+from app.config import OCR_DPI, OCR_GRAYSCALE, OCR_WORKERS
+from app import ocr_cache, ocr_utils
+
+SAMPLES_DIR = os.path.join(PROJECT_ROOT, "pdf_samples")
+
+
+def load_pages(samples_dir):
+    """Rasterize every page of every sample once, outside the timings."""
+    docs = []
+    for name in sorted(os.listdir(samples_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(samples_dir, name), "rb") as f:
+            images = convert_from_bytes(f.read(), dpi=OCR_DPI, grayscale=OCR_GRAYSCALE)
+        docs.append((name, dict(enumerate(images))))
+    return docs
+
+
+def timed_ocr(pages, workers):
+    t0 = time.perf_counter()
+    texts = ocr_utils._ocr_pages(pages, workers=workers)
+    return time.perf_counter() - t0, texts
+
+
+def bench_ocr(samples_dir, workers):
+    """
+    OCR every page of every sample (as if all were scanned), serially and
+    on the process pool, and check both give the same text in page order.
+    """
+    docs = load_pages(samples_dir)
+    total_pages = sum(len(pages) for _, pages in docs)
+    print(f"\n=== OCR: {len(docs)} PDFs, {total_pages} pages, {workers} workers ===\n")
+
+    # Pay process start-up once, and report it separately
+    t0 = time.perf_counter()
+    ocr_utils._get_pool(workers)
+    first = next((pages for _, pages in docs if len(pages) > 1), None)
+    if first:
+        ocr_utils._ocr_pages(dict(list(first.items())[:2]), workers=workers)
+    print(f"Pool warm-up: {time.perf_counter() - t0:.2f} s\n")
+
+    print(f"{'file':<48} {'pages':>5} {'serial s':>9} {'parallel s':>10} {'speedup':>8} {'same':>5}")
+    serial_total = parallel_total = 0.0
+    for name, pages in docs:
+        serial_s, serial_texts = timed_ocr(pages, 1)
+        parallel_s, parallel_texts = timed_ocr(pages, workers)
+        serial_total += serial_s
+        parallel_total += parallel_s
+        same = list(serial_texts.items()) == list(parallel_texts.items())
+        print(f"{name[:48]:<48} {len(pages):>5} {serial_s:>9.2f} {parallel_s:>10.2f} "
+              f"{serial_s / parallel_s:>7.2f}x {'yes' if same else 'NO':>5}")
+
+    print(f"\n{'total':<48} {total_pages:>5} {serial_total:>9.2f} {parallel_total:>10.2f} "
+          f"{serial_total / parallel_total:>7.2f}x")
+
+
+def image_mb(images):
+    return sum(img.width * img.height * len(img.getbands()) for img in images) / 1e6
+
+
+def bench_extract(samples_dir):
+    """
+    Full extract_text_pdf per sample vs the old up-front conversion of
+    every page. Digital-text pages should now never be rasterized.
+    """
+    rendered = []
+    render_page = ocr_utils._render_page
+
+    def counting_render(pdf_bytes, page_number):
+        img = render_page(pdf_bytes, page_number)
+        if img is not None:
+            rendered.append(img)
+        return img
+
+    ocr_utils._render_page = counting_render
+    ocr_cache._cache.path = ""  # time the real work, not earlier runs' cache
+
+    print("\n=== EXTRACT: lazy rasterization vs converting every page ===\n")
+    print(f"{'file':<48} {'method':>10} {'extract s':>9} {'rendered':>8} {'MB':>7} "
+          f"{'all-pages s':>11} {'MB':>7}")
+    for name in sorted(os.listdir(samples_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(samples_dir, name), "rb") as f:
+            pdf_bytes = f.read()
+
+        rendered.clear()
+        t0 = time.perf_counter()
+        _, method = ocr_utils.extract_text_pdf(pdf_bytes)
+        extract_s = time.perf_counter() - t0
+        lazy_mb = image_mb(rendered)
+
+        t0 = time.perf_counter()
+        images = convert_from_bytes(pdf_bytes)
+        eager_s = time.perf_counter() - t0
+
+        print(f"{name[:48]:<48} {method:>10} {extract_s:>9.2f} {len(rendered):>8} {lazy_mb:>7.1f} "
+              f"{eager_s:>11.2f} {image_mb(images):>7.1f}")
+
+    ocr_utils._render_page = render_page
+
+
+def synthetic_pages(n, texts=None):
+    """
+    Letter pages at 200 dpi with lines of text, for machines without
+    poppler. If given, `texts` is filled with each page's text.
+    """
+    pages = {}
+    for i in range(n):
+        img = Image.new("L", (1700, 2200), 255)
+        draw = ImageDraw.Draw(img)
+        line = f"Page {i + 1}: the mitochondria is the powerhouse of the cell. " * 2
+        lines = range(150, 2050, 36)
+        for y in lines:
+            draw.text((120, y), line, fill=0)
+        pages[i] = img.rotate(-2, expand=True, fillcolor=255) if i % 2 else img
+        if texts is not None:
+            texts[i] = "\n".join(line.strip() for _ in lines)
+    return pages
+
+
+def legacy_preprocess(img):
+    """The old path: PIL point() per engine, plus np.array for EasyOCR."""
+    for_tesseract = img.convert("L").point(lambda x: 0 if x < 180 else 255, "1")
+    for_easyocr = np.array(img.convert("L").point(lambda x: 0 if x < 180 else 255, "1"))
+    return for_tesseract, for_easyocr
+
+
+def bench_preprocess(samples_dir, synthetic):
+    """Per-page preprocessing time and Python-visible allocations (tracemalloc)."""
+    if synthetic:
+        pages = list(synthetic_pages(synthetic).values())
+    else:
+        pages = [img for _, doc in load_pages(samples_dir) for img in doc.values()]
+
+    def new_path(threshold, deskew):
+        def run(img):
+            ocr_utils.OCR_THRESHOLD, ocr_utils.OCR_DESKEW = threshold, deskew
+            return ocr_utils._preprocess_for_ocr(img)
+        return run
+
+    variants = [
+        ("legacy (point, x2)", legacy_preprocess),
+        ("numpy fixed", new_path("fixed", False)),
+        ("numpy adaptive", new_path("adaptive", False)),
+        ("numpy fixed+deskew", new_path("fixed", True)),
+    ]
+
+    print(f"\n=== PREPROCESS: {len(pages)} pages ===\n")
+    print("(tracemalloc sees NumPy buffers, not PIL's own image memory)\n")
+    print(f"{'variant':<22} {'ms/page':>8} {'peak MB':>8}")
+    for label, fn in variants:
+        times, peaks = [], []
+        for img in pages:
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            fn(img)
+            times.append(time.perf_counter() - t0)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        print(f"{label:<22} {np.mean(times) * 1000:>8.1f} {max(peaks) / 1e6:>8.1f}")
+
+
+def bench_classify(samples_dir, time_ocr):
+    """
+    Page decisions of the classifier vs the old rule, per sample. With
+    time_ocr, also renders + OCRs every page the old rule would have
+    OCR'd, to put a number on the time the new decisions save.
+    """
+    import pdfplumber
+
+    print("\n=== CLASSIFY: page decisions vs the old rule ===\n")
+    print(f"{'file':<44} {'pages':>5} {'text':>5} {'mixed':>5} {'scan':>5} "
+          f"{'old OCR':>7} {'new OCR':>7} {'saved s':>8}")
+    totals = {"pages": 0, "old": 0, "new": 0, "saved": 0.0}
+    for name in sorted(os.listdir(samples_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(samples_dir, name), "rb") as f:
+            pdf_bytes = f.read()
+
+        counts = {"text": 0, "mixed": 0, "scanned": 0}
+        old = new = 0
+        saved = 0.0
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            for i, page in enumerate(pdf.pages):
+                features = ocr_utils._page_features(page, page.extract_text() or "")
+                page_type = ocr_utils._decide_page(features)
+                counts[page_type] += 1
+                old += ocr_utils._legacy_needs_ocr(features)
+                new += page_type != "text"
+                if time_ocr and page_type == "text" and ocr_utils._legacy_needs_ocr(features):
+                    t0 = time.perf_counter()
+                    img = ocr_utils._render_page(pdf_bytes, i + 1)
+                    if img is not None:
+                        ocr_utils._ocr_page(img)
+                    saved += time.perf_counter() - t0
+
+        totals["pages"] += len(pdf.pages)
+        totals["old"] += old
+        totals["new"] += new
+        totals["saved"] += saved
+        print(f"{name[:44]:<44} {len(pdf.pages):>5} {counts['text']:>5} {counts['mixed']:>5} "
+              f"{counts['scanned']:>5} {old:>7} {new:>7} {saved if time_ocr else float('nan'):>8.2f}")
+
+    print(f"\n{'total':<44} {totals['pages']:>5} {'':>5} {'':>5} {'':>5} "
+          f"{totals['old']:>7} {totals['new']:>7} "
+          f"{totals['saved'] if time_ocr else float('nan'):>8.2f}")
+
+
+# ---------- engine / config matrix ----------
+
+MATRIX_ENGINES = ("pdfplumber", "tesseract", "easyocr")
+FALLBACK_THRESHOLDS = (0, 10, 30, 60, 100, 200)  # Tesseract chars before EasyOCR is tried
+
+
+def _normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def levenshtein(a, b):
+    """Edit distance, one NumPy row at a time (insertions via a running min)."""
+    if not a or not b:
+        return len(a) + len(b)
+    b_codes = np.frombuffer(b.encode("utf-32-le"), dtype=np.uint32)
+    offsets = np.arange(len(b) + 1)
+    prev = offsets.copy()
+    for i, ch in enumerate(a, 1):
+        cost = (b_codes != ord(ch)).astype(np.int64)
+        cur = np.empty_like(prev)
+        cur[0] = i
+        # deletion / substitution, then insertions: cur[j] = min_k<=j tmp[k] + (j - k)
+        cur[1:] = np.minimum(prev[1:] + 1, prev[:-1] + cost)
+        cur = np.minimum.accumulate(cur - offsets) + offsets
+        prev = cur
+    return int(prev[-1])
+
+
+def char_accuracy(text, reference):
+    """1 - CER against the reference (case and whitespace ignored), floored at 0."""
+    ref = _normalize(reference)
+    if not ref:
+        return None
+    return max(0.0, 1.0 - levenshtein(_normalize(text), ref) / len(ref))
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)  # bytes on macOS, KB elsewhere
+
+
+def _reference_texts(samples_dir):
+    """
+    {(doc, page): text layer} for pages whose pdfplumber text the
+    classifier trusts, plus each page's classifier features.
+    """
+    import pdfplumber
+
+    references, features = {}, {}
+    for name in sorted(os.listdir(samples_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with pdfplumber.open(os.path.join(samples_dir, name)) as pdf:
+            for i, page in enumerate(pdf.pages):
+                text = page.extract_text() or ""
+                f = ocr_utils._page_features(page, text)
+                features[(name, i)] = f
+                if f["text_len"] >= ocr_utils._MIN_TEXT_CHARS and f["quality"] >= ocr_utils._MIN_QUALITY:
+                    references[(name, i)] = text
+    return references, features
+
+
+def _matrix_pages(samples_dir, synthetic, dpi):
+    """Yield (doc, page, image) at `dpi`, rendering one page at a time."""
+    if synthetic:
+        for i, img in synthetic_pages(synthetic).items():
+            if dpi != 200:
+                img = img.resize((img.width * dpi // 200, img.height * dpi // 200), Image.BILINEAR)
+            yield "synthetic", i, img
+        return
+
+    ocr_utils.OCR_DPI = dpi
+    for name in sorted(os.listdir(samples_dir)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(samples_dir, name), "rb") as f:
+            pdf_bytes = f.read()
+        for i in range(ocr_utils._page_count(pdf_bytes)):
+            img = ocr_utils._render_page(pdf_bytes, i + 1)
+            if img is not None:
+                yield name, i, img
+
+
+def _run_config(engine, dpi, threshold, samples_dir, synthetic):
+    """
+    One matrix cell, run in its own process so ru_maxrss is this
+    configuration's peak. Returns per-page (doc, page, ms, text) and
+    memory / model-load numbers. Rendering is not in the page times.
+    """
+    start_rss = _peak_rss_mb()
+    load_ms = 0.0
+    pages = []
+
+    if engine == "pdfplumber":
+        import pdfplumber
+        for name in sorted(os.listdir(samples_dir)):
+            if not name.lower().endswith(".pdf"):
+                continue
+            with pdfplumber.open(os.path.join(samples_dir, name)) as pdf:
+                for i, page in enumerate(pdf.pages):
+                    t0 = time.perf_counter()
+                    text = page.extract_text() or ""
+                    pages.append((name, i, (time.perf_counter() - t0) * 1000, text))
+    else:
+        if engine == "easyocr":
+            t0 = time.perf_counter()
+            try:
+                ocr_utils.get_model("easyocr")
+            except Exception as e:
+                print("EasyOCR unavailable:", e)
+            load_ms = (time.perf_counter() - t0) * 1000
+        ocr_utils.OCR_THRESHOLD = threshold
+        run = ocr_utils._ocr_tesseract if engine == "tesseract" else ocr_utils._ocr_easyocr
+
+        for name, i, img in _matrix_pages(samples_dir, synthetic, dpi):
+            t0 = time.perf_counter()
+            # "none": grayscale straight to the engine, no binarization
+            arr = np.array(img.convert("L")) if threshold == "none" else ocr_utils._preprocess_for_ocr(img)
+            text = run(arr)
+            pages.append((name, i, (time.perf_counter() - t0) * 1000, text))
+
+    peak = _peak_rss_mb()
+    return {"pages": pages, "load_ms": load_ms, "peak_rss_mb": peak,
+            "start_rss_mb": start_rss}
+
+
+def _fallback_analysis(records):
+    """
+    Replay the hybrid rule (Tesseract unless it returns <= T chars, then
+    EasyOCR) for several T, from the per-engine results of each config.
+    """
+    by_key = {}
+    for r in records:
+        if r["engine"] in ("tesseract", "easyocr") and r["accuracy"] is not None:
+            by_key.setdefault((r["dpi"], r["threshold"], r["doc"], r["page"]), {})[r["engine"]] = r
+
+    rows = []
+    configs = sorted({k[:2] for k in by_key})
+    for dpi, threshold in configs:
+        pairs = [v for k, v in by_key.items() if k[:2] == (dpi, threshold) and len(v) == 2]
+        if not pairs:
+            continue
+        for limit in FALLBACK_THRESHOLDS:
+            acc, ms, fell_back = [], [], 0
+            for pair in pairs:
+                tess, easy = pair["tesseract"], pair["easyocr"]
+                if tess["chars"] > limit:
+                    acc.append(tess["accuracy"])
+                    ms.append(tess["ms"])
+                else:
+                    acc.append(easy["accuracy"])
+                    ms.append(tess["ms"] + easy["ms"])
+                    fell_back += 1
+            rows.append({"dpi": dpi, "threshold": threshold, "fallback_chars": limit,
+                         "pages": len(pairs), "easyocr_pages": fell_back,
+                         "accuracy": round(float(np.mean(acc)), 4), "ms_per_page": round(float(np.mean(ms)), 1)})
+    return rows
+
+
+def bench_matrix(samples_dir, engines, dpis, thresholds, synthetic, output):
+    """
+    Every engine x DPI x threshold over the samples: per-page latency,
+    peak RSS and character accuracy against the pdfplumber text layer
+    (pages the classifier would trust) or the known synthetic text.
+    """
+    import multiprocessing
+
+    if synthetic:
+        texts = {}
+        synthetic_pages(synthetic, texts)
+        references = {("synthetic", i): t for i, t in texts.items()}
+        features = {}
+        engines = [e for e in engines if e != "pdfplumber"]
+    else:
+        references, features = _reference_texts(samples_dir)
+
+    configs = []
+    for engine in engines:
+        if engine == "pdfplumber":
+            configs.append((engine, None, None))
+        else:
+            configs += [(engine, dpi, thr) for dpi in dpis for thr in thresholds]
+
+    print(f"\n=== OCR MATRIX: {len(configs)} configurations, "
+          f"{len(references)} pages with a reference text ===\n")
+    print(f"{'engine':<11} {'dpi':>4} {'thresh':>8} {'pages':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'load s':>7} {'peak MB':>8} {'accuracy':>8}")
+
+    ctx = multiprocessing.get_context("spawn")
+    records, summaries = [], []
+    for engine, dpi, threshold in configs:
+        with ctx.Pool(1) as pool:
+            cell = pool.apply(_run_config, (engine, dpi, threshold, samples_dir, synthetic))
+
+        accuracies = []
+        for doc, page, ms, text in cell["pages"]:
+            ref = references.get((doc, page))
+            acc = char_accuracy(text, ref) if ref is not None else None
+            if acc is not None:
+                accuracies.append(acc)
+            records.append({"engine": engine, "dpi": dpi, "threshold": threshold, "doc": doc,
+                            "page": page, "ms": round(ms, 1), "chars": len(text.strip()),
+                            "accuracy": round(acc, 4) if acc is not None else None})
+
+        times = [ms for _, _, ms, _ in cell["pages"]]
+        summary = {
+            "engine": engine, "dpi": dpi, "threshold": threshold, "pages": len(times),
+            "p50_ms": round(float(np.percentile(times, 50)), 1) if times else None,
+            "p95_ms": round(float(np.percentile(times, 95)), 1) if times else None,
+            "load_ms": round(cell["load_ms"], 1),
+            "peak_rss_mb": round(cell["peak_rss_mb"], 1) if cell["peak_rss_mb"] else None,
+            "start_rss_mb": round(cell["start_rss_mb"], 1) if cell["start_rss_mb"] else None,
+            "accuracy": round(float(np.mean(accuracies)), 4) if accuracies else None,
+            "scored_pages": len(accuracies),
+        }
+        summaries.append(summary)
+        fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+        print(f"{engine:<11} {dpi or '-':>4} {threshold or '-':>8} {summary['pages']:>5} "
+              f"{fmt(summary['p50_ms'], '>8.1f')} {fmt(summary['p95_ms'], '>8.1f')} "
+              f"{summary['load_ms'] / 1000:>7.1f} {fmt(summary['peak_rss_mb'], '>8.0f')} "
+              f"{fmt(summary['accuracy'], '>8.3f')}")
+
+    fallback = _fallback_analysis(records)
+    if fallback:
+        print("\nHybrid rule (EasyOCR when Tesseract returns <= N chars; the app uses 30):")
+        print(f"{'dpi':>4} {'thresh':>8} {'N':>4} {'easyocr pages':>13} {'accuracy':>8} {'ms/page':>8}")
+        for row in fallback:
+            print(f"{row['dpi']:>4} {row['threshold']:>8} {row['fallback_chars']:>4} "
+                  f"{row['easyocr_pages']:>13} {row['accuracy']:>8.3f} {row['ms_per_page']:>8.1f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "configs": summaries,
+            "fallback": fallback,
+            "pages": records,
+            # classifier inputs per page, to tune its cutoffs against accuracy
+            "features": [{"doc": d, "page": p, "has_reference": (d, p) in references, **f}
+                         for (d, p), f in sorted(features.items())],
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PDF rasterization and OCR.")
+    parser.add_argument("mode", nargs="?", choices=["ocr", "extract", "preprocess", "classify", "matrix"],
+                        default="ocr",
+                        help="ocr: serial vs parallel page OCR; extract: lazy rasterization; "
+                             "preprocess: image preprocessing time and allocations; "
+                             "classify: page decisions vs the old rule; "
+                             "matrix: latency / memory / accuracy per engine, DPI and threshold")
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    parser.add_argument("--workers", type=int, default=max(OCR_WORKERS, 2))
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="preprocess / matrix: use N generated pages instead of pdf_samples/")
+    parser.add_argument("--time-ocr", action="store_true",
+                        help="classify: also time OCR on the pages no longer OCR'd")
+    parser.add_argument("--engines", default=",".join(MATRIX_ENGINES), help="matrix: engines to run")
+    parser.add_argument("--dpis", default="150,200,300", help="matrix: rasterization DPIs")
+    parser.add_argument("--thresholds", default="none,fixed,adaptive",
+                        help="matrix: binarization before OCR (none = plain grayscale)")
+    parser.add_argument("--output", default=os.path.join(PROJECT_ROOT, "data", "bench_ocr_matrix.json"),
+                        help="matrix: JSON results file (data/ is git-ignored)")
+    args = parser.parse_args()
+
+    if args.mode == "extract":
+        bench_extract(args.samples)
+    elif args.mode == "preprocess":
+        bench_preprocess(args.samples, args.synthetic)
+    elif args.mode == "classify":
+        bench_classify(args.samples, args.time_ocr)
+    elif args.mode == "matrix":
+        bench_matrix(args.samples, args.engines.split(","), [int(d) for d in args.dpis.split(",")],
+                     args.thresholds.split(","), args.synthetic, args.output)
+    else:
+        bench_ocr(args.samples, args.workers)
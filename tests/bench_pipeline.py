@@ -0,0 +1,302 @@
+"""
+Offline benchmark of the whole process-note pipeline.
+
+Drives /api/process-note (or /api/process-note/stream) through the Flask
+test client against tests/fake_llm_server.py, so no network or API key is
+needed. For each corpus size (notes already in SQLite + the RAG store)
+and concurrency level it sends --requests unique notes and reports:
+  - throughput and end-to-end latency percentiles
+  - time to first summary token (stream endpoint)
+  - per-stage percentiles from the telemetry spans (ocr, embed, search,
+    llm, each llm_call, db_write, rag_index, ...)
+
+Results go to --output as JSON; --baseline compares against an earlier
+file and exits non-zero when p95 latency or throughput regress by more
+than --tolerance.
+
+    python tests/bench_pipeline.py --concurrency 1,4,8 --corpus 0,1000 --hash-embedder
+
+Everything (SQLite, RAG store, telemetry) lives in a temporary directory;
+the LLM response cache is off so every request reaches the fake server.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMServer
+
+DIM = 384  # all-MiniLM-L6-v2
+PDF_DIR = os.path.join(PROJECT_ROOT, "pdf_samples")
+TOPICS = [
+    "photosynthesis chlorophyll light energy glucose carbon dioxide oxygen leaf stomata",
+    "derivative limit slope tangent function rate of change chain rule product rule",
+    "mitosis meiosis chromosome cell division spindle nucleus gamete diploid haploid",
+    "supply demand equilibrium price elasticity market surplus shortage consumer producer",
+    "newton force mass acceleration momentum friction gravity inertia velocity vector",
+    "tangent ratio opposite adjacent hypotenuse angle triangle sine cosine trigonometry",
+    "revolution monarchy parliament treaty empire colony trade reform war constitution",
+    "atom electron proton neutron isotope bond covalent ionic molecule periodic table",
+]
+
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in for MiniLM (--hash-embedder): a signed hashed
+    bag of words, unit length. Notes on the same topic still land near
+    each other, so retrieval does realistic work without torch.
+    """
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        vecs = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.encode("utf-8"))
+                vecs[row, h % DIM] += 1.0 if h & 0x10000 else -1.0
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.maximum(norms, 1e-12)
+
+
+def make_note(rng, serial, words=180):
+    """A unique note on a random topic (unique so no cache can answer it)."""
+    vocab = rng.choice(TOPICS).split()
+    body = " ".join(rng.choice(vocab) for _ in range(words))
+    return f"Study note {serial}. {body.capitalize()}."
+
+
+def pct(values, q):
+    return round(float(np.percentile(values, q)), 1) if len(values) else None
+
+
+def summarize(values):
+    return {"count": len(values), "p50": pct(values, 50), "p95": pct(values, 95),
+            "p99": pct(values, 99), "mean": round(float(np.mean(values)), 1) if values else None}
+
+
+# ---------- one level ----------
+
+def _client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    return client
+
+
+def _send(app, endpoint, note, pdf):
+    """(status, latency_ms, first_token_ms or None) for one request."""
+    client = _client(app)
+    if pdf:
+        name = os.path.basename(pdf)
+        with open(pdf, "rb") as f:
+            data = {"file": (io.BytesIO(f.read()), name)}
+    else:
+        data = {"note_text": note}
+
+    t0 = time.perf_counter()
+    if endpoint == "json":
+        resp = client.post("/api/process-note", data=data)
+        return resp.status_code, (time.perf_counter() - t0) * 1000, None
+
+    resp = client.post("/api/process-note/stream", data=data, buffered=False)
+    first_token, status = None, resp.status_code
+    for chunk in resp.response:
+        chunk = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        if first_token is None and "event: summary" in chunk:
+            first_token = (time.perf_counter() - t0) * 1000
+        if "event: error" in chunk:
+            status = 500
+    resp.close()
+    return status, (time.perf_counter() - t0) * 1000, first_token
+
+
+def _stage_timings(telemetry_file, skip_rows):
+    """Span durations by stage from telemetry rows after the first skip_rows."""
+    stages = {}
+    with open(telemetry_file, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))[skip_rows:]
+    for row in rows:
+        details = json.loads(row["details"] or "{}")
+        for span in details.get("spans", []):
+            name = span["name"] + (f":{span['call']}" if "call" in span else "")
+            stages.setdefault(name, []).append(span["ms"])
+    return {name: summarize(ms) for name, ms in sorted(stages.items())}, len(rows)
+
+
+def run_level(app, telemetry, server, args, rng, corpus, concurrency, serial):
+    notes = [make_note(rng, serial + i) for i in range(args.requests)]
+    pdfs = sorted(os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.endswith(".pdf")) \
+        if args.input == "pdf" else []
+    jobs = [(note, pdfs[i % len(pdfs)] if pdfs else None) for i, note in enumerate(notes)]
+
+    telemetry.flush()
+    with open(telemetry.TELEMETRY_FILE, newline="", encoding="utf-8") as f:
+        rows_before = sum(1 for _ in csv.DictReader(f))
+    llm_before = server.stats["requests"]
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    with quiet:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda job: _send(app, args.endpoint, *job), jobs))
+        wall_s = time.perf_counter() - t0
+        telemetry.flush()
+
+    stages, logged = _stage_timings(telemetry.TELEMETRY_FILE, rows_before)
+    ok = [r for r in results if r[0] == 200]
+    return {
+        "corpus": corpus,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 3),
+        "latency_ms": summarize([r[1] for r in ok]),
+        "first_token_ms": summarize([r[2] for r in ok if r[2] is not None]) if args.endpoint == "stream" else None,
+        "stages_ms": stages,
+        "telemetry_rows": logged,
+        "llm_requests": server.stats["requests"] - llm_before,
+    }
+
+
+# ---------- driver ----------
+
+def seed_corpus(database, rag, rng, count, serial):
+    """Add `count` notes to SQLite and the RAG store, as earlier uploads would have."""
+    for i in range(count):
+        text = make_note(rng, serial + i)
+        note_id = database.save_note(text, "- seeded", "[]", "2025-01-01T00:00:00")
+        rag.add_note_to_rag(note_id, text)
+
+
+def compare(results, baseline_path, tolerance):
+    """Print deltas vs a baseline run; False if any level regressed past tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["corpus"], r["concurrency"]): r for r in json.load(f)["runs"]}
+
+    print(f"\n=== VS BASELINE {baseline_path} (tolerance {tolerance:.0%}) ===\n")
+    ok = True
+    for run in results["runs"]:
+        old = baseline.get((run["corpus"], run["concurrency"]))
+        if not old or not old["latency_ms"]["p95"] or not run["latency_ms"]["p95"]:
+            continue
+        p95 = run["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1
+        rps = run["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+        regressed = p95 > tolerance or rps < -tolerance
+        ok &= not regressed
+        print(f"{'❌' if regressed else '✅'} corpus {run['corpus']:>6} x{run['concurrency']:<3} "
+              f"p95 {p95:+.1%}  throughput {rps:+.1%}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of /api/process-note.")
+    parser.add_argument("--concurrency", default="1,4,8", help="comma-separated levels")
+    parser.add_argument("--corpus", default="0,100,1000",
+                        help="comma-separated RAG corpus sizes (notes seeded before each)")
+    parser.add_argument("--requests", type=int, default=24, help="requests per level")
+    parser.add_argument("--endpoint", choices=["json", "stream"], default="json")
+    parser.add_argument("--input", choices=["text", "pdf"], default="text",
+                        help="pasted notes, or uploads from pdf_samples/ (OCR path)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake server seconds per response")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake server seconds per streamed word")
+    parser.add_argument("--llm-mode", choices=["concurrent", "combined", "sequential"], default=None)
+    parser.add_argument("--hash-embedder", action="store_true",
+                        help="deterministic hashing embedder instead of MiniLM (no torch needed)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(PROJECT_ROOT, "data", "bench_pipeline_results.json"),
+                        help="JSON results file (data/ is git-ignored)")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own logging")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    corpus_sizes = sorted(int(c) for c in args.corpus.split(","))
+
+    server = FakeLLMServer(latency_s=args.llm_latency, token_delay_s=args.token_delay).start()
+    tmp = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.environ.update({
+        "OPENAI_API_BASE": server.base_url,
+        "OPENAI_API_KEY": "bench",
+        "DB_PATH": os.path.join(tmp, "memory.db"),
+        "RAG_STORE_DIR": os.path.join(tmp, "rag"),
+        "TELEMETRY_FILE": os.path.join(tmp, "telemetry.csv"),
+        "LLM_CACHE_PATH": "",
+        "OCR_CACHE_PATH": "",
+        "JOB_WORKERS": "0",
+        "MODEL_WARMUP": "",
+    })
+    if args.llm_mode:
+        os.environ["LLM_MODE"] = args.llm_mode
+
+    # Imported only now: app.config reads the environment at import time
+    from app import database, models, rag, telemetry
+    if args.hash_embedder:
+        models.register("embedder", HashingEmbedder)
+    from app.app import app
+
+    rng = random.Random(args.seed)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "verbose")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "embedder": "hashing" if args.hash_embedder else models.EMBEDDING_MODEL,
+        },
+        "runs": [],
+    }
+
+    print(f"\n=== PIPELINE BENCH: {args.endpoint} endpoint, {args.input} input, "
+          f"LLM {args.llm_latency * 1000:.0f} ms, {args.requests} requests per level ===\n")
+    print(f"{'corpus':>7} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+    serial, seeded = 0, 0
+    # Warm-up request: model load, first connections, SQLite migrations
+    with contextlib.redirect_stdout(io.StringIO()):
+        _send(app, "json", make_note(rng, -1), None)
+
+    for corpus in corpus_sizes:
+        seed_corpus(database, rag, rng, corpus - seeded, 1_000_000 + seeded)
+        seeded = corpus
+        for concurrency in levels:
+            run = run_level(app, telemetry, server, args, rng, corpus, concurrency, serial)
+            serial += args.requests
+            results["runs"].append(run)
+            lat = run["latency_ms"]
+            print(f"{corpus:>7} {concurrency:>5} {run['throughput_rps']:>8.2f} {lat['p50'] or 0:>9.1f} "
+                  f"{lat['p95'] or 0:>9.1f} {lat['p99'] or 0:>9.1f} {run['errors']:>7}")
+
+    print("\nStages (ms) at the largest corpus / concurrency:")
+    for name, s in results["runs"][-1]["stages_ms"].items():
+        print(f"  {name:<22} p50 {s['p50']:>9.1f}  p95 {s['p95']:>9.1f}  (n={s['count']})")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    server.stop()
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from app import rag
+from app.vector_search import ExactSearch, IVFSearch, make_backend
+
+CHECKPOINTS = [10, 100, 1_000, 10_000, 100_000]
+DIM = 384  # all-MiniLM-L6-v2
+
+
+def fake_encode(texts):
+    """
+    Random unit vectors in place of the encoder, so the numbers below
+    measure the index itself rather than MiniLM.
+    """
+    vecs = np.random.standard_normal((len(texts), DIM)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+
+def fake_note_texts(note_ids):
+    """Stand-in for the SQLite lookup, so queries time the index only."""
+    return {note_id: f"note text {note_id}" for note_id in note_ids}
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) * 1e6  # seconds -> µs
+
+
+def bench_adds(total, window):
+    """
+    Add `total` notes one at a time and report per-add latency for the
+    last `window` adds before each checkpoint.
+    """
+    print("\n=== RAG ADD LATENCY ===\n")
+    print(f"{'notes':>8} {'p50 µs':>10} {'p99 µs':>10} {'max µs':>10} {'query ms':>10}")
+
+    timings = []
+    for i in range(1, total + 1):
+        t0 = time.perf_counter()
+        rag.add_note_to_rag(i, f"note text {i}")
+        timings.append(time.perf_counter() - t0)
+
+        if i in CHECKPOINTS:
+            recent = timings[-window:]
+            t1 = time.perf_counter()
+            rag.query_context("query", k=4)
+            query_ms = (time.perf_counter() - t1) * 1000
+            print(f"{i:>8} {pct(recent, 50):>10.1f} {pct(recent, 99):>10.1f} "
+                  f"{max(recent) * 1e6:>10.1f} {query_ms:>10.2f}")
+
+
+def clustered_vectors(n, clusters=256, noise=0.6, seed=0):
+    """
+    Unit vectors drawn around random topic centres. Real embeddings are
+    clustered like this; uniform random vectors would be a worst case for
+    IVF and unrepresentative.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, DIM)).astype(np.float32)
+    vecs = centres[rng.integers(0, clusters, n)]
+    vecs += noise * rng.standard_normal((n, DIM)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+
+def bench_search(n, k, queries):
+    """Recall@k and latency of each backend against exact search."""
+    print(f"\n=== RAG SEARCH: {n} vectors, recall@{k}, {queries} queries ===\n")
+    matrix = clustered_vectors(n)
+    qs = clustered_vectors(queries, seed=1)
+
+    exact = ExactSearch()
+    truth = [set(exact.search(matrix, n, q, k)[0].tolist()) for q in qs]
+
+    configs = [("exact", exact)]
+    configs += [(f"ivf nprobe={p}", IVFSearch(nprobe=p)) for p in (1, 4, 8, 16, 32)]
+    for ef in (16, 64, 128):
+        backend = make_backend("hnsw", ef=ef)
+        if backend.name == "hnsw":
+            configs.append((f"hnsw ef={ef}", backend))
+
+    print(f"{'backend':<16} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8}")
+    for label, backend in configs:
+        backend.reset()
+        backend.add(matrix, 0, n)
+        # Training (IVF) and the first search (HNSW inserts lazily) are
+        # the build; time them separately.
+        t0 = time.perf_counter()
+        if backend.needs_training(n):
+            backend.install(backend.train(matrix, n), matrix, n)
+        backend.search(matrix, n, qs[0], k)
+        build_s = time.perf_counter() - t0
+
+        latencies, hits = [], 0
+        for q, expected in zip(qs, truth):
+            t0 = time.perf_counter()
+            idx, _ = backend.search(matrix, n, q, k)
+            latencies.append(time.perf_counter() - t0)
+            hits += len(expected & set(idx.tolist()))
+
+        print(f"{label:<16} {hits / (k * len(qs)):>8.3f} {pct(latencies, 50) / 1000:>8.3f} "
+              f"{pct(latencies, 95) / 1000:>8.3f} {build_s:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the RAG index.")
+    parser.add_argument("mode", nargs="?", choices=["add", "search"], default="add",
+                        help="add: per-add latency; search: recall@k vs latency per backend")
+    parser.add_argument("--notes", type=int, default=CHECKPOINTS[-1])
+    parser.add_argument("--window", type=int, default=1000,
+                        help="adds sampled before each checkpoint")
+    parser.add_argument("--real-model", action="store_true",
+                        help="use MiniLM instead of random vectors (slow)")
+    parser.add_argument("--store", action="store_true",
+                        help="back the index with the memory-mapped on-disk store")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.mode == "search":
+        bench_search(args.notes, args.k, args.queries)
+        sys.exit(0)
+
+    if not args.real_model:
+        rag._encode = fake_encode
+    rag.get_note_texts = fake_note_texts
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rag.init_vector_store(store_dir=tmp if args.store else None, rehydrate=False)
+        bench_adds(args.notes, args.window)
+
+        if args.store:
+            t0 = time.perf_counter()
+            rag.init_vector_store(store_dir=tmp, rehydrate=False)
+            print(f"\nReopened store with {rag._size} rows in "
+                  f"{(time.perf_counter() - t0) * 1000:.2f} ms")
@@ -0,0 +1,177 @@
+"""
+Local stand-in for an OpenAI-compatible /chat/completions endpoint, so
+client and pipeline tests can run without network access.
+
+    server = FakeLLMServer(latency_s=0.2).start()
+    os.environ["OPENAI_API_BASE"] = server.base_url
+    ...
+    server.stop()
+
+Counts TCP connections and requests so tests can check keep-alive reuse,
+and can answer the first N requests with 429 to exercise retries.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY = "- Key idea one\n- Key idea two\n- Key idea three"
+FLASHCARDS = [
+    {"question": "What is the key idea?", "answer": "Key idea one."},
+    {"question": "What follows from it?", "answer": "Key idea two."},
+]
+
+
+def canned_reply(messages):
+    """Pick a plausible answer from the prompt the app sent."""
+    prompt = messages[-1]["content"] if messages else ""
+    if '"summary"' in prompt:
+        return json.dumps({"summary": SUMMARY.replace("- ", "").split("\n"), "flashcards": FLASHCARDS})
+    if "JSON" in prompt:
+        return json.dumps({"flashcards": FLASHCARDS})
+    return SUMMARY
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        server = self.server
+        with server.stats_lock:
+            server.stats["requests"] += 1
+            throttle = server.stats["requests"] <= server.fail_first
+
+        if throttle:
+            with server.stats_lock:
+                server.stats["throttled"] += 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        time.sleep(server.latency_s)
+
+        content = canned_reply(request.get("messages", []))
+        prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_chars // 4 + len(content) // 4,
+        }
+
+        if request.get("stream"):
+            self._stream(request, content, usage)
+            return
+
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, request, content, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish=None, extra=None):
+            payload = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if extra:
+                payload.update(extra)
+            data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for word in content.split(" "):
+            chunk({"content": word + " "})
+            time.sleep(self.server.token_delay_s)
+        chunk({}, finish="stop")
+        # Like OpenAI: usage only on request, in a last chunk without choices
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk(None, extra={"choices": [], "usage": usage})
+
+        done = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer:
+    def __init__(self, latency_s=0.0, token_delay_s=0.0, fail_first=0, port=0):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.latency_s = latency_s
+        self._httpd.token_delay_s = token_delay_s
+        self._httpd.fail_first = fail_first
+        self._httpd.stats = {"connections": 0, "requests": 0, "throttled": 0}
+        self._httpd.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def stats(self):
+        with self._httpd.stats_lock:
+            return dict(self._httpd.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the stand-in LLM server.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per response")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(latency_s=args.latency, port=args.port).start()
+    print(f"Fake LLM server on {server.base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+
+import pdfplumber
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from app import ocr_utils
+
+# A digital worksheet page with almost no letters: tables and equations
+NUMERIC_LINES = [
+    "1.  3x + 7 = 22      x = 5",
+    "2.  12 / 4 + 2^3 = 11",
+    "3.  (4.5 * 2) - 1.25 = 7.75",
+    "4.  sqrt(144) = 12;  15% of 80 = 12",
+    "12 in = 1 ft   3 ft = 1 yd   1760 yd = 1 mi",
+    "2.54 cm = 1 in   30.48 cm = 1 ft   0.9144 m = 1 yd",
+    "| 1 | 2.54 | 30.48 | 91.44 |",
+    "| 2 | 5.08 | 60.96 | 182.88 |",
+]
+PROSE = ("The tangent ratio compares the side opposite an angle with the side "
+         "adjacent to it in a right triangle.")
+
+
+def check(name, ok, detail):
+    print(f"{'✅ PASS' if ok else '❌ FAIL'} {name}: {detail}")
+    return ok
+
+
+def text_pdf(lines):
+    """Minimal one-page PDF drawing `lines` in Helvetica (a real text layer)."""
+    ops = ["BT", "/F1 12 Tf", "14 TL", "72 720 Td"]
+    for line in lines:
+        escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        ops.append(f"({escaped}) Tj T*")
+    ops.append("ET")
+    stream = "\n".join(ops).encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % n + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def run_classifier_tests():
+    print("\n=== PAGE CLASSIFIER TESTS ===\n")
+    results = []
+
+    # 1) A numeric / equation page keeps its text layer and is not OCR'd
+    with pdfplumber.open(io.BytesIO(text_pdf(NUMERIC_LINES))) as pdf:
+        stats = {}
+        page_type, text = ocr_utils._inspect_page(pdf, 0, stats)
+        features = ocr_utils._page_features(pdf.pages[0], pdf.pages[0].extract_text() or "")
+    results.append(check("numeric page stays text", page_type == "text" and "3x + 7 = 22" in text,
+                         f"type={page_type}, quality={features['quality']}, {len(text)} chars kept"))
+
+    # 2) Ordinary prose is text too
+    with pdfplumber.open(io.BytesIO(text_pdf([PROSE]))) as pdf:
+        page_type, text = ocr_utils._inspect_page(pdf, 0)
+    results.append(check("prose page stays text", page_type == "text" and text.startswith("The tangent"),
+                         f"type={page_type}"))
+
+    # 3) Unmapped glyphs still score as garbage; digits and symbols don't
+    garbage = ocr_utils._text_quality("(cid:12)(cid:40)(cid:7) (cid:3)(cid:91) ��")
+    numeric = ocr_utils._text_quality("\n".join(NUMERIC_LINES) + " ∑ ∫ ≤ ± × ÷ π")
+    results.append(check("quality score", garbage < ocr_utils._MIN_QUALITY <= numeric,
+                         f"cid text {garbage:.2f}, numeric text {numeric:.2f}"))
+
+    # 4) A garbage text layer sends the page to OCR without its glyphs
+    features = {"text_len": 120, "words": 20, "images": 0, "coverage": 0.0,
+                "overlay": 0.0, "ink": 0, "quality": garbage}
+    results.append(check("garbage page OCR'd", ocr_utils._decide_page(features) == "scanned",
+                         ocr_utils._decide_page(features)))
+
+    passed = sum(results)
+    print(f"\n{passed}/{len(results)} passed")
+    return passed == len(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_classifier_tests() else 1)
@@ -0,0 +1,105 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Every call has to reach the fake server: no LLM response cache.
+# Set before app.config is imported.
+os.environ["LLM_CACHE_PATH"] = ""
+# Small pool so leaked connections run out quickly, and a short timeout
+# so a leak shows up as a failure instead of a minute-long hang
+os.environ["LLM_POOL_SIZE"] = "4"
+os.environ["LLM_TIMEOUT_S"] = "5"
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMServer
+
+SEQUENTIAL_CALLS = 20
+CONCURRENT_CALLS = 40
+CONCURRENCY = 8
+
+
+def check(name, ok, detail):
+    print(f"{'✅ PASS' if ok else '❌ FAIL'} {name}: {detail}")
+    return ok
+
+
+def run_client_pool_tests():
+    server = FakeLLMServer(latency_s=0.05, fail_first=2).start()
+    os.environ["OPENAI_API_BASE"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+    from app import llm
+    llm.reset_client()
+
+    print("\n=== LLM CLIENT POOL TESTS ===\n")
+    results = []
+
+    # 1) Same object everywhere, including across threads
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        clients = set(map(id, pool.map(lambda _: llm.get_client(), range(CONCURRENCY))))
+    results.append(check("shared client", len(clients) == 1 and id(llm.get_client()) in clients,
+                         f"{len(clients)} distinct client(s)"))
+
+    # 2) First two requests are 429s; the SDK should back off and retry
+    summary, _ = llm.generate_summary("Photosynthesis converts light into sugar.", [])
+    stats = server.stats
+    results.append(check("429 retry", bool(summary) and stats["throttled"] == 2 and stats["requests"] == 3,
+                         f"{stats['throttled']} throttled of {stats['requests']} requests, then got a summary"))
+
+    # 3) Sequential calls ride one keep-alive connection
+    before = server.stats
+    for i in range(SEQUENTIAL_CALLS):
+        llm.generate_summary(f"Cells are the basic unit of life. ({i})", [])
+    opened = server.stats["connections"] - before["connections"]
+    served = server.stats["requests"] - before["requests"]
+    results.append(check("sequential reuse", opened <= 1 and served == SEQUENTIAL_CALLS,
+                         f"{served}/{SEQUENTIAL_CALLS} calls reached the server "
+                         f"over {opened} new connection(s)"))
+
+    # 4) Concurrent calls never open more than the pool allows
+    before = server.stats
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        list(pool.map(lambda i: llm.generate_summary(f"Derivatives measure change. ({i})", []),
+                      range(CONCURRENT_CALLS)))
+    opened = server.stats["connections"] - before["connections"]
+    served = server.stats["requests"] - before["requests"]
+    results.append(check("concurrent reuse", opened <= CONCURRENCY and served == CONCURRENT_CALLS,
+                         f"{served}/{CONCURRENT_CALLS} calls at concurrency {CONCURRENCY} "
+                         f"reached the server over {opened} new connection(s)"))
+
+    llm.reset_client()
+    server.stop()
+
+    # 5) Streams dropped mid-way (SSE client gone) give their connection back:
+    #    more aborted streams than the pool holds, then a normal call. The
+    #    closed generators are kept alive, so only an explicit close frees them.
+    server = FakeLLMServer(token_delay_s=0.2).start()
+    os.environ["OPENAI_API_BASE"] = server.base_url
+    from app.config import LLM_POOL_SIZE
+    aborted = []
+    try:
+        for i in range(LLM_POOL_SIZE + 2):
+            stream = llm.stream_summary(f"Osmosis moves water across membranes. ({i})", [])
+            next(stream)
+            stream.close()
+            aborted.append(stream)
+        summary, _ = llm.generate_summary("Enzymes lower activation energy.", [])
+        detail = f"{len(aborted)} aborted streams, then a summary"
+    except Exception as e:
+        summary, detail = "", f"call after {len(aborted)} aborted streams failed: {type(e).__name__}"
+    results.append(check("aborted streams", bool(summary), detail))
+
+    llm.reset_client()
+    server.stop()
+
+    print("\n=== FINAL REPORT ===")
+    print(f"Pass rate: {sum(results)} / {len(results)}")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_client_pool_tests() else 1)
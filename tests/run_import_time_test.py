@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by the models, never by booting the app
+HEAVY_MODULES = ["torch", "sentence_transformers", "easyocr", "transformers"]
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app.app
+elapsed = time.perf_counter() - t0
+print(json.dumps({
+    "seconds": elapsed,
+    "heavy": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_import():
+    """Time `import app.app` in a fresh interpreter, as a web worker would."""
+    env = dict(os.environ, MODEL_WARMUP="")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run_import_time_test(budget_s, runs):
+    print("\n=== APP IMPORT TIME ===\n")
+    # First run also pays for .pyc compilation and a cold disk cache
+    measure_import()
+    samples = [measure_import() for _ in range(runs)]
+    best = min(s["seconds"] for s in samples)
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+
+    print(f"import app.app: best {best * 1000:.0f} ms of {runs} (budget {budget_s * 1000:.0f} ms)")
+    results = [best <= budget_s, not heavy]
+    print(f"{'✅ PASS' if results[0] else '❌ FAIL'} import budget")
+    print(f"{'✅ PASS' if results[1] else '❌ FAIL'} no models at import: "
+          f"{', '.join(heavy) if heavy else 'none of ' + ', '.join(HEAVY_MODULES)} loaded")
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the app imports without loading models.")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    sys.exit(0 if run_import_time_test(args.budget, args.runs) else 1)
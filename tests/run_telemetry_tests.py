@@ -0,0 +1,142 @@
+import csv
+import fcntl
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Small rotation threshold so the multi-process test rotates several times.
+# Set before app.config is imported (here and in the spawned writers).
+TMP_DIR = os.environ.setdefault("TELEMETRY_TEST_DIR", tempfile.mkdtemp())
+os.environ["TELEMETRY_FILE"] = os.path.join(TMP_DIR, "telemetry.csv")
+os.environ["TELEMETRY_MAX_MB"] = "0.05"
+os.environ["TELEMETRY_BACKUPS"] = "50"
+os.environ["TELEMETRY_FLUSH_S"] = "0.05"
+os.environ["TELEMETRY_QUEUE_SIZE"] = "2000"
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from app import telemetry
+
+PROCESSES = 4
+ROWS_PER_PROCESS = 500
+DETAILS = {"ocr_method": "txt", "spans": [{"name": "llm_call", "ms": 812.4, "call": "summary"}]}
+
+
+def check(name, ok, detail):
+    print(f"{'✅ PASS' if ok else '❌ FAIL'} {name}: {detail}")
+    return ok
+
+
+def _write_rows(worker):
+    for i in range(ROWS_PER_PROCESS):
+        telemetry.log_telemetry(f"p{worker}", i, 0, 0, 0.0, None, DETAILS)
+    telemetry.flush()
+
+
+def _read_all():
+    """Data rows across telemetry.csv and its rotated files, plus bad files."""
+    rows, bad = [], []
+    for path in glob.glob(telemetry.TELEMETRY_FILE + "*"):
+        if path.endswith(".lock"):
+            continue
+        with open(path, newline="", encoding="utf-8") as f:
+            lines = list(csv.reader(f))
+        if not lines or lines[0] != telemetry.FIELDNAMES or telemetry.FIELDNAMES in lines[1:]:
+            bad.append(os.path.basename(path))
+        rows.extend(lines[1:])
+    return rows, bad
+
+
+def run_telemetry_tests():
+    print("\n=== TELEMETRY TESTS ===\n")
+    results = []
+
+    # 1) Logging only queues: no file I/O in the caller
+    t0 = time.perf_counter()
+    for i in range(1000):
+        telemetry.log_telemetry("rag", i, 10, 20, 0.0, None, DETAILS)
+    per_call_us = (time.perf_counter() - t0) * 1e6 / 1000
+    flushed = telemetry.flush()
+    rows, bad = _read_all()
+    stats = telemetry.telemetry_stats()
+    results.append(check("non-blocking", flushed and len(rows) == 1000 and per_call_us < 200,
+                         f"{per_call_us:.1f} µs/call, {len(rows)} rows in {stats['batches']} batch(es)"))
+
+    # 2) A full queue (TELEMETRY_QUEUE_SIZE=2000) drops rows instead of
+    #    blocking the request while the writer is stuck on the file lock
+    with open(telemetry.TELEMETRY_FILE + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        t0 = time.perf_counter()
+        for i in range(3000):
+            telemetry.log_telemetry("rag", i, 0, 0, 0.0, None, None)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        dropped = telemetry.telemetry_stats()["dropped"]
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    flushed = telemetry.flush()
+    results.append(check("bounded queue", flushed and dropped >= 800 and elapsed_ms < 500,
+                         f"{dropped} of 3000 dropped while the writer was stalled, {elapsed_ms:.1f} ms"))
+
+    # 3) Several processes append + rotate the same file without losing rows
+    for path in glob.glob(telemetry.TELEMETRY_FILE + "*"):
+        os.remove(path)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_write_rows, args=(w,)) for w in range(PROCESSES)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    rows, bad = _read_all()
+    files = len(glob.glob(telemetry.TELEMETRY_FILE + "*")) - 1
+    expected = PROCESSES * ROWS_PER_PROCESS
+    intact = all(len(r) == len(telemetry.FIELDNAMES) and json.loads(r[-1]) == DETAILS for r in rows)
+    results.append(check("multi-process rotation", len(rows) == expected and not bad and intact,
+                         f"{len(rows)}/{expected} rows over {files} file(s), "
+                         f"{len(bad)} with a bad header"))
+
+    # 4) Spans record offsets, durations and attributes
+    trace = telemetry.Trace()
+    with trace.span("ocr", bytes=10) as span:
+        time.sleep(0.02)
+        span["method"] = "pdfplumber"
+    trace.add("llm_call", 5.0, call="summary")
+    ocr, call = trace.spans
+    results.append(check("spans", ocr["ms"] >= 20 and ocr["method"] == "pdfplumber"
+                         and "start_ms" in ocr and call == {"name": "llm_call", "ms": 5.0, "call": "summary"},
+                         json.dumps(trace.spans)))
+
+    # 5) Rolling percentiles from the histogram track the exact ones
+    from app import metrics
+    rng = np.random.default_rng(0)
+    latencies = rng.lognormal(8, 0.8, 5000)  # ~3 s median, long tail
+    now = time.time()
+    for i, ms in enumerate(latencies):
+        metrics.observe("bench", float(ms), 100, 50, 0.001, "err" if i % 50 == 0 else None, ts=now - i * 0.5)
+    report = metrics.snapshot(["1h"])["1h"]["pathways"]["bench"]
+    worst = max(abs(report["latency_ms"][f"p{q}"] / np.percentile(latencies, q) - 1) for q in (50, 95, 99))
+    results.append(check("window percentiles", worst < 0.05 and report["requests"] == 5000
+                         and report["error_rate"] == 0.02,
+                         f"p50/p95/p99 within {worst * 100:.1f}% of exact, "
+                         f"{report['requests']} requests, error rate {report['error_rate']}"))
+
+    # 6) Prometheus exposition: cumulative buckets end at the request count
+    text = metrics.prometheus_text()
+    inf = next(line for line in text.splitlines()
+               if line.startswith('studybuddy_request_latency_seconds_bucket{pathway="bench",le="+Inf"}'))
+    results.append(check("prometheus text", inf.endswith(" 5000") and "# TYPE studybuddy_requests_total counter" in text,
+                         inf))
+
+    passed = sum(results)
+    print(f"\n{passed}/{len(results)} passed")
+    return passed == len(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_telemetry_tests() else 1)
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+# Small prompt budget and a priced model; set before app.config is imported
+os.environ["LLM_PROMPT_TOKENS"] = "600"
+os.environ["OPENAI_MODEL"] = "openai/gpt-4o-mini"
+os.environ["LLM_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_cache.db")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+# Add project root to Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMServer
+
+NOTE = "Mitochondria produce ATP through oxidative phosphorylation. " * 10
+PASSAGES = [f"Passage {i}: " + "cellular respiration and the electron transport chain " * 12 for i in range(6)]
+
+
+def check(name, ok, detail):
+    print(f"{'✅ PASS' if ok else '❌ FAIL'} {name}: {detail}")
+    return ok
+
+
+def run_token_tests():
+    server = FakeLLMServer().start()
+    os.environ["OPENAI_API_BASE"] = server.base_url
+
+    from app import llm, tokens
+    llm.reset_client()
+    model = llm._model_name()
+
+    print(f"\n=== TOKEN BUDGET TESTS (tokenizer: {tokens.tokenizer_name(model)}) ===\n")
+    results = []
+
+    # 1) Context is cut to the budget: best passages kept, the rest dropped
+    messages, chunks, fit = llm._messages(llm.SUMMARY_SYSTEM, llm.SUMMARY_PROMPT, NOTE, PASSAGES, model)
+    prompt_tokens = tokens.count_messages(messages, model)
+    results.append(check("prompt budget", prompt_tokens <= 600 and 0 < fit["passages"] < len(PASSAGES)
+                         and chunks[0] == PASSAGES[0] and fit["dropped"] == len(PASSAGES) - len(chunks),
+                         f"{prompt_tokens} prompt tokens, {fit}"))
+
+    # 2) Non-streamed calls report the provider's usage, priced per model
+    summary, usage = llm.generate_summary(NOTE, PASSAGES)
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    expected_cost = (usage["prompt_tokens"] * 0.15 + usage["completion_tokens"] * 0.60) / 1e6
+    results.append(check("response usage", usage["prompt_tokens"] == prompt_chars // 4
+                         and not usage["estimated"] and abs(usage["cost_usd"] - expected_cost) < 1e-12,
+                         f"{usage['prompt_tokens']} in / {usage['completion_tokens']} out, "
+                         f"${usage['cost_usd']:.8f}"))
+
+    # 3) Streamed calls read usage from the final chunk (include_usage)
+    stream = llm.stream_summary(NOTE + " Streamed.", PASSAGES)
+    try:
+        while True:
+            next(stream)
+    except StopIteration as done:
+        _, stream_usage = done.value
+    results.append(check("stream usage", stream_usage["completion_tokens"] > 0 and not stream_usage["estimated"],
+                         f"{stream_usage['prompt_tokens']} in / {stream_usage['completion_tokens']} out"))
+
+    # 4) Cache hits cost nothing
+    _, cached = llm.generate_summary(NOTE, PASSAGES)
+    results.append(check("cache hit", cached["cached"] and cached["cost_usd"] == 0 and cached["prompt_tokens"] == 0,
+                         f"cached={cached['cached']}, ${cached['cost_usd']}"))
+
+    # 5) Price lookup: provider prefix ignored, ":free" models are free
+    results.append(check("price table", tokens.price("gpt-4o-mini") == tokens.price("openai/gpt-4o-mini")
+                         and tokens.cost_usd("amazon/nova-2-lite-v1:free", 10**6, 10**6) == 0,
+                         f"gpt-4o-mini {tokens.price('gpt-4o-mini')}"))
+
+    # 6) A malformed LLM_PRICES is ignored, not an import error
+    probe = subprocess.run(
+        [sys.executable, "-c", "from app import tokens; print(tokens.price('gpt-4o-mini'))"],
+        cwd=PROJECT_ROOT, env={**os.environ, "LLM_PRICES": "{gpt-4o-mini: 0.1}"},
+        capture_output=True, text=True,
+    )
+    results.append(check("malformed LLM_PRICES", probe.returncode == 0 and "(0.15, 0.6)" in probe.stdout,
+                         probe.stdout.strip().splitlines()[-1] if probe.stdout.strip() else probe.stderr[-200:]))
+
+    llm.reset_client()
+    server.stop()
+
+    print("\n=== FINAL REPORT ===")
+    print(f"Pass rate: {sum(results)} / {len(results)}")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_token_tests() else 1)